@@ -1,17 +1,22 @@
-import csv
+import argparse
+import json
 import logging
+import multiprocessing
 import os
 import sys
-from nltk.tokenize import word_tokenize
-from nltk import pos_tag
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.dml import MSO_LINE_DASH_STYLE
-from pptx.enum.shapes import MSO_SHAPE
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
-import spacy
-import re
+from pptx.util import Inches
+from analysis import analyse_cells, analyse_table, core_row_cells, process_row_cells
+from cell_index import ACTIVITY_COLUMN, RESOURCE_COLUMN, CellIndex
+import nlp_models
+from layout import GridLayout, PagedSlides, node_size
+from renderer import ACTIVITY, BOUNDARY, DECISION, DECISION_CONDITION, RESOURCE, SUB_BUBBLE, VERB, SlideRenderer
+from sipoc import SipocTable
+from slide_cache import add_slide_from_xml, slide_cache_key, slide_xml
 
 # Create a logger instance
 logger = logging.getLogger('merged_logger')
@@ -24,32 +29,46 @@ formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 
-# Load the spaCy English model
-nlp = spacy.load("en_core_web_sm")
+# Version of the slide output, part of the deck cache key.
+# Bump it whenever a change alters the generated slides so cached decks are not reused.
+GENERATOR_VERSION = "4"
 
-# Create a single Presentation object
-combined_presentation = Presentation()
 
-def process_script1(filename_with_identifier, combined_presentation): #Script1:Core Process Statement
-    try:
-        logger.info("Processing Script 1")
+def output_version():
+    """Version of the generated slides for the deck and slide cache keys.
+
+    Decks also depend on which verb tagger found the verbs, and which version
+    of it, so a tagger or model upgrade invalidates them like the phrase cache.
+    """
+    tagger = nlp_models.get_verb_tagger()
+    return f"{GENERATOR_VERSION}-{tagger.name}-{tagger.version}"
+
+
+# Stages generate_presentation reports to its progress callback, in the order they usually finish
+PIPELINE_STAGES = ['index', 'nlp', 'script1', 'script2', 'script3', 'script4', 'script5', 'assemble', 'save']
+
+# Processes running the NLP-heavy scripts in parallel mode, created on first use
+PROCESS_POOL_WORKERS = 2
+_process_pool = None
+_process_pool_lock = threading.Lock()
 
-        # Construct the complete file path
-        file_path = os.path.join(filename_with_identifier)
+# Table files the command line accepts
+TABLE_EXTENSIONS = ('.csv', '.xlsx')
 
-        with open(file_path, 'r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            rows = list(csv_reader)
+def process_script1(table, combined_presentation, analysis=None): #Script1:Core Process Statement
+    try:
+        logger.info("Processing Script 1")
+        rows = table.rows
 
         # Create a blank slide
         slide_layout = combined_presentation.slide_layouts[5]
         slide = combined_presentation.slides.add_slide(slide_layout)
+        renderer = SlideRenderer(slide)
 
         # Define position and size for oval shapes
         num_cells = 7
         oval_width = Inches(2)
         oval_height = Inches(0.8)
-        text_font_size = Pt(18)
         slide_width = combined_presentation.slide_width
         slide_height = combined_presentation.slide_height
 
@@ -68,70 +87,36 @@ def process_script1(filename_with_identifier, combined_presentation): #Script1:C
             if i == 0:  #First cell in column A
             # Extract the first word from cells A1 and F1
                 red_text = rows[1][0].split()[0]  # Get the first word from cell A1
-            # Create rectangle shape
-                shape = slide.shapes.add_shape(MSO_SHAPE.ROUNDED_RECTANGLE, left, top, oval_width, oval_height)
-                shape.fill.solid()
-                shape.fill.fore_color.rgb = RGBColor(255, 255, 255)  # White background for rectangles
-
-            # Create oval shape with red background
-                oval_shape = slide.shapes.add_shape(MSO_SHAPE.OVAL, left+x_step, top+y_step, oval_width, oval_height)
-                oval_shape.fill.solid()
-                oval_shape.fill.fore_color.rgb = RGBColor(255, 0, 0)  # Red background
+            # Create rectangle shape, and an oval with red background for the first word
+                renderer.add(BOUNDARY, left, top, oval_width, oval_height, cell)
+                renderer.add(RESOURCE, left+x_step, top+y_step, oval_width, oval_height, red_text)
     
             elif i == 5:  # First cell in column F
                 red_text = rows[1][5].split()[0]  # Get the first word from cell F1
-            
-            # Create rectangle shape
-                shape = slide.shapes.add_shape(MSO_SHAPE.ROUNDED_RECTANGLE, left+x_step, top+y_step, oval_width, oval_height)
-                shape.fill.solid()
-                shape.fill.fore_color.rgb = RGBColor(255, 255, 255)  # White background for rectangles
-            
-            # Create oval shape with red background
-                oval_shape = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, oval_width, oval_height)
-                oval_shape.fill.solid()
-                oval_shape.fill.fore_color.rgb = RGBColor(255, 0, 0)  # Red background
+            # Create rectangle shape, and an oval with red background for the first word
+                renderer.add(BOUNDARY, left+x_step, top+y_step, oval_width, oval_height, cell)
+                renderer.add(RESOURCE, left, top, oval_width, oval_height, red_text)
             
             elif i == 1: # Column B
             # Create oval shape with green background
-                shape = slide.shapes.add_shape(MSO_SHAPE.OVAL, left+x_step, top+y_step, oval_width, oval_height)
-                shape.fill.solid()
-                shape.fill.fore_color.rgb = RGBColor(0, 255, 0)  # Green background
+                renderer.add(ACTIVITY, left+x_step, top+y_step, oval_width, oval_height, cell)
             elif i == 2:  # Column C
             # Create oval shape with red background
-                shape = slide.shapes.add_shape(MSO_SHAPE.OVAL, left+x_step, top+y_step, oval_width, oval_height)
-                shape.fill.solid()
-                shape.fill.fore_color.rgb = RGBColor(255, 0, 0)  # Red background
+                renderer.add(RESOURCE, left+x_step, top+y_step, oval_width, oval_height, cell)
             elif i == 4:  # Column E
             # Create oval shape with green background
-                shape = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, oval_width, oval_height)
-                shape.fill.solid()
-                shape.fill.fore_color.rgb = RGBColor(0, 255, 0)  # Green background
-
-            text_frame = shape.text_frame
-            text_frame.text = cell
-            text_frame.paragraphs[0].font.size = text_font_size
-            text_frame.paragraphs[0].font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-            text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
-            # Add text to oval shape
-            oval_text_frame = oval_shape.text_frame
-            oval_text_frame.text = red_text  # Use the extracted first word as text
-            oval_text_frame.paragraphs[0].font.size = text_font_size
-            oval_text_frame.paragraphs[0].font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-            oval_text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
-        # Load the spaCy English model
-        nlp = spacy.load("en_core_web_sm")
+                renderer.add(ACTIVITY, left, top, oval_width, oval_height, cell)
+        # Tag the cells now unless the shared analysis stage already did
+        if analysis is None:
+            analysis = analyse_cells(core_row_cells(table))
         # Use to extract verbs from the second row, ignoring column D
         verbs = []
         for i, cell in enumerate(rows[1]):
             # Skip column D
             if i == 3:
                 continue
-            # Apply spaCy NLP pipeline to the cell content
-            doc = nlp(cell)
             # Extract verbs
-            for token in doc:
-                if token.pos_ == 'VERB':
-                    verbs.append(token.text)
+            verbs.extend(analysis.get(cell).verbs)
         # Divide the list of verbs into chunks of five
         verbs_chunks = [verbs[i:i+5] for i in range(0, len(verbs), 5)]
         # Define position and size for text boxes
@@ -143,341 +128,511 @@ def process_script1(filename_with_identifier, combined_presentation): #Script1:C
         for chunk in verbs_chunks:
             left = left_margin
             for word in chunk:
-                textbox = slide.shapes.add_textbox(left, top_margin, box_width, box_height)
-                textbox.text_frame.text = word
-                textbox.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER  # Align the text to the center
+                renderer.add(VERB, left, top_margin, box_width, box_height, word)  # Text centred in the box
                 left += box_width
                 top_margin -= box_height  # Move to the next line
         logger.info("script1 executed successfully")
+        return True
     except Exception as e:
         logging.error(f'An error occurred in Script 1: {str(e)}')
+        return False
         
-def process_script2(filename_with_identifier, combined_presentation):  # Script2: Non-Core-Process-Statment
+def process_script2(table, combined_presentation, index=None):  # Script2: Non-Core-Process-Statment
     try:
         logger.info("Processing Script 2")
-        # Get the file name with the identifier from the command-line arguments
-        filename_with_identifier = sys.argv[1]
-
-        # Construct the complete file path
-        file_path = os.path.join(filename_with_identifier)
-
-        with open(file_path, 'r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            rows = list(csv_reader)
-            # Remove first two rows
-            rows = rows[2:]
+        # Classify the cells now unless the shared index stage already did
+        if index is None:
+            index = CellIndex(table)
 
-        # Create a blank slide
+        # Create a blank slide, continued on more slides if the ovals do not fit
         slide_layout = combined_presentation.slide_layouts[5]  # Blank slide layout
-        slide = combined_presentation.slides.add_slide(slide_layout)
+        pages = PagedSlides(combined_presentation, slide_layout)
+        pages.renderer(0)
 
-        # Define position and size for oval shapes
-        num_cells = len(rows[0])
+        # Define position and size for oval shapes; ovals grow with their text up to max_width
         node_width = Inches(2)
         node_height = Inches(0.8)
-        text_font_size = Pt(18)
-        top_margin = Inches(1.0)
-        left_margin = Inches(0.5)
-        left = left_margin
-        top = top_margin
-        slide_width = combined_presentation.slide_width
-        slide_height = combined_presentation.slide_height
-
-    # Calculate the diagonal line positions
-        # diagonal_length = (slide_width ** 2 + slide_height ** 2) ** 0.5
-        x_step = slide_width / num_cells
-        y_step = slide_height / num_cells
-    
-        # Create oval shapes and add text to them with specified font and background colors
-        j = 0
-        while j< len(rows):
-            row=rows[j]  
-            for i, cell in enumerate(row):
-                if not cell or i==0 or i==3 or i==5  or '(' in cell: 
-                    continue
-                if i==1 or i==4:
-                    # Create oval shape with Green background
-                    oval = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, node_width, node_height)
-                    oval.fill.solid()
-                    oval.fill.fore_color.rgb = RGBColor(0, 255, 0) 
-                    text_frame = oval.text_frame
-                    text_frame.text = cell
-                    text_frame.paragraphs[0].font.size = text_font_size
-                    text_frame.paragraphs[0].font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-                    text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
-                    left += node_width
-                    if left + node_width > Inches(10):
-                        left = left_margin
-                        top += node_height
-                    
-                if i==2:
-                    # Create oval shape with Green background
-                    oval = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, node_width, node_height)
-                    oval.fill.solid()
-                    oval.fill.fore_color.rgb = RGBColor(255, 0, 0)  # Red background
-                    text_frame = oval.text_frame
-                    text_frame.text = cell
-                    text_frame.paragraphs[0].font.size = text_font_size
-                    text_frame.paragraphs[0].font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-                    text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
-                    left += node_width
-                    if left + node_width > Inches(10):
-                        left = left_margin
-                        top += node_height
-            j += 1  
+        max_width = Inches(4)
+        layout = GridLayout(combined_presentation.slide_width, combined_presentation.slide_height,
+                            left_margin=Inches(0.5), top_margin=Inches(1.0))
+
+        # Create oval shapes: green for activities and outputs (columns B and E), red for resources (column C),
+        # skipping the heading and core process statement rows and cells with sub-bubbles
+        for cell in index.statements():
+            style = RESOURCE if cell.column == RESOURCE_COLUMN else ACTIVITY
+            width, height = node_size(cell.text, style.font_size, node_width, node_height, max_width)
+            page, left, top = layout.place(width, height)
+            pages.renderer(page).add(style, left, top, width, height, cell.text)
         logger.info("script2 executed successfully")   
+        return True
     except Exception as e:
         # Log any exceptions that occur
         logging.error(f'An error occurred: {str(e)}')
+        return False
         
-def process_script3(filename_with_identifier, combined_presentation): #Script3: SUb-bubbles/ Bracket.py
+def process_script3(table, combined_presentation, index=None): #Script3: SUb-bubbles/ Bracket.py
     try:
         logger.info("Processing Script 3")
-        # Input CSV file name
-        filename_without_extension = os.path.splitext(filename_with_identifier)[0]
-
-        # List to store words between parentheses
-        parentheses_words = []
-        # Regular expression pattern to find words between parentheses
-        pattern = r'\(([^)]*)\)'  # Match everything between '(' and ')'
-
-        with open(filename_with_identifier, 'r', newline='') as csv_input:
-            reader = csv.reader(csv_input)
-            for row in reader:
-                for idx, cell in enumerate(row):
-                    # Skip processing cells in columns A and F (indexes 0 and 5 respectively)
-                    if idx in [0, 5]:
-                        continue
-                    # Find all words between parentheses in the cell and store them
-                    matches = re.findall(pattern, cell)
-                    parentheses_words.extend(matches)
-                    
-        # Write words between parentheses to a temporary CSV file
-        temp_csv_filename = filename_without_extension + '_subbubbles' + '.csv'
-        with open(temp_csv_filename, 'w', newline='') as temp_csv_file:
-            writer = csv.writer(temp_csv_file)
-            writer.writerow(['Words Between Parentheses'])  # Header
-            writer.writerows([[word] for word in parentheses_words])   
-
-        # Set to store unique words between parentheses
-        unique_parentheses_words = set()
-
-        # Read unique words between parentheses from the temporary CSV file
-        with open(temp_csv_filename, 'r', newline='') as csv_input:
-            reader = csv.reader(csv_input)
-            next(reader)  # Skip the header row
-
-            for row in reader:
-                for cell in row:
-                    unique_parentheses_words.add(cell)
-   
-        # Create a blank slide
+        if index is None:
+            index = CellIndex(table)
+
+        # Create a blank slide, continued on more slides if the bubbles do not fit
         slide_layout = combined_presentation.slide_layouts[5]  # Blank slide layout
-        slide = combined_presentation.slides.add_slide(slide_layout)
+        pages = PagedSlides(combined_presentation, slide_layout)
+        pages.renderer(0)
 
-        # Calculate the positions to fit all nodes within the slide
+        # Bubbles grow with their text up to max_width
         node_width = Inches(2.5)
         node_height = Inches(1.0)
-        left_margin = Inches(0.5)
-        top_margin = Inches(1.0)
-        left = left_margin
-        top = top_margin
-
-        # Create elliptical shapes in PowerPoint for unique words
-        for word in unique_parentheses_words:
-            shape = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, node_width, node_height)
-            shape.fill.solid()
-            shape.fill.fore_color.rgb = RGBColor(255, 255, 255)  # White background
-            text = shape.text_frame.add_paragraph()
-            text.text = word
-            text.alignment = 1  # Center align text
-            text.font.size = Pt(18)
-            text.font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-            shape.line.color.rgb = RGBColor(0, 0, 0)  # Black border
-            shape.line.width = Pt(1.5)  # Border width
-            left += node_width
-
-            if left + node_width > Inches(10):
-                left = left_margin
-                top += node_height
+        max_width = Inches(4)
+        layout = GridLayout(combined_presentation.slide_width, combined_presentation.slide_height,
+                            left_margin=Inches(0.5), top_margin=Inches(1.0))
+
+        # Create elliptical shapes in PowerPoint for unique words, in first-seen order
+        for word in index.sub_bubbles():
+            # White oval with a black border
+            width, height = node_size(word, SUB_BUBBLE.font_size, node_width, node_height, max_width)
+            page, left, top = layout.place(width, height)
+            pages.renderer(page).add(SUB_BUBBLE, left, top, width, height, word)
                 
         logger.info("script3 executed successfully")        
+        return True
     except Exception as e:
         logger.error(f'An error occurred: {str(e)}')
+        return False
         
-def process_script4(filename_with_identifier, combined_presentation): # Script4: Decision_Bubbles.py
+def process_script4(table, combined_presentation, index=None): # Script4: Decision_Bubbles.py
     try:
         logger.info("Processing script4")
+        if index is None:
+            index = CellIndex(table)
 
-        # Construct the complete file path
-        file_path = os.path.join(filename_with_identifier)
-
-        with open(file_path, 'r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            rows = list(csv_reader)
-
-        # Create a blank slide
+        # Create a blank slide, continued on more slides if the decisions do not fit
         slide_layout = combined_presentation.slide_layouts[5]  # Blank slide layout
-        slide = combined_presentation.slides.add_slide(slide_layout)
-
-        # Define initial positions for ovals
-        left = Inches(0.5)
-        top = Inches(1.5)
-
-        # Iterate over all cells in the CSV file
-        for row in rows:
-            for idx, cell in enumerate(row):
-                # Skip processing cells in columns A and F (indexes 0 and 5 respectively)
-                if idx in [0, 5]:
-                    continue
-
-                # Check if the cell begins with "or:" case-insensitive
-                if cell.lower().startswith("or:"):
-                    # Extract the phrase after "or:"
-                    phrase = cell[3:].strip()
-
-                    # Check if the phrase contains parentheses
-                    if '(' in phrase and ')' in phrase:
-                        # Split the phrase into main and inner phrases
-                        main_phrase, inner_phrase = phrase.split('(', 1)
-                        inner_phrase = inner_phrase[:-1]  # Remove the closing parenthesis
-
-                        # Create the outer oval for the main phrase
-                        outer_oval = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, Inches(3), Inches(1.5))
-                        outer_oval.line.color.rgb = RGBColor(0, 0, 0)  # Black color for the border
-                        outer_oval.line.width = Pt(1)  # Border width
-                        outer_oval.line.dash_style = MSO_LINE_DASH_STYLE.DASH  # Dotted line border
-                        outer_oval.fill.solid()
-                        outer_oval.fill.fore_color.rgb = RGBColor(255, 255, 255)  # White background
-
-                        # Add the main phrase to the outer oval
-                        text_frame_outer = outer_oval.text_frame
-                        p_outer = text_frame_outer.add_paragraph()
-                        p_outer.text = main_phrase.strip()
-                        p_outer.font.size = Pt(14)  # Adjust font size as needed
-                        p_outer.font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-                        p_outer.alignment = PP_ALIGN.CENTER  # Center align text
-
-                        # Create the inner oval for the phrase inside parentheses
-                        inner_oval = slide.shapes.add_shape(MSO_SHAPE.OVAL, left + Inches(0.5), top + Inches(0.3), Inches(2), Inches(0.8))
-                        inner_oval.line.color.rgb = RGBColor(0, 0, 0)  # Black color for the border
-                        inner_oval.line.width = Pt(1)  # Border width
-                        inner_oval.fill.solid()
-                        inner_oval.fill.fore_color.rgb = RGBColor(255, 255, 255)  # White background
-
-                        # Add the inner phrase to the inner oval
-                        text_frame_inner = inner_oval.text_frame
-                        p_inner = text_frame_inner.add_paragraph()
-                        p_inner.text = inner_phrase.strip()
-                        p_inner.font.size = Pt(12)  # Adjust font size as needed
-                        p_inner.font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-                        p_inner.alignment = PP_ALIGN.CENTER  # Center align text
-
-                    else:
-                        # Create a black dotted line oval for the extracted phrase
-                        oval = slide.shapes.add_shape(MSO_SHAPE.OVAL, left, top, Inches(3), Inches(1.5))
-                        oval.line.color.rgb = RGBColor(0, 0, 0)  # Black color for the border
-                        oval.line.width = Pt(1)  # Border width
-                        oval.line.dash_style = MSO_LINE_DASH_STYLE.DASH  # Dotted line border
-                        oval.fill.solid()
-                        oval.fill.fore_color.rgb = RGBColor(255, 255, 255)  # White background
-
-                        # Add the extracted phrase to the oval
-                        text_frame = oval.text_frame
-                        p = text_frame.add_paragraph()
-                        p.text = phrase.strip()
-                        p.font.size = Pt(14)  # Adjust font size as needed
-                        p.font.color.rgb = RGBColor(0, 0, 0)  # Black font color
-                        p.alignment = PP_ALIGN.CENTER  # Center align text
-
-                    # Update positions for the next oval
-                    left += Inches(3.5)
-                    if left + Inches(3) > Inches(10):
-                        left = Inches(0.5)
-                        top += Inches(2)
+        pages = PagedSlides(combined_presentation, slide_layout)
+        pages.renderer(0)
+
+        # Ovals are at least 3 x 1.5 inches, half an inch apart
+        layout = GridLayout(combined_presentation.slide_width, combined_presentation.slide_height,
+                            left_margin=Inches(0.5), top_margin=Inches(1.5), gap_x=Inches(0.5), gap_y=Inches(0.5))
+        max_width = Inches(5)
+
+        # Cells in columns B-E beginning with "or:" (case-insensitive), split into phrase and condition
+        for cell in index.decisions():
+            if cell.condition is not None:
+                # The outer oval leaves room around the inner one
+                inner_width, inner_height = node_size(
+                    cell.condition, DECISION_CONDITION.font_size, Inches(2), Inches(0.8), max_width - Inches(1)
+                )
+                width, height = node_size(cell.phrase, DECISION.font_size, inner_width + Inches(1),
+                                          max(Inches(1.5), inner_height + Inches(0.7)), max_width)
+                page, left, top = layout.place(width, height)
+                renderer = pages.renderer(page)
+
+                # Create the dotted outer oval for the main phrase
+                renderer.add(DECISION, left, top, width, height, cell.phrase)
+
+                # Create the inner oval for the phrase inside parentheses
+                renderer.add(DECISION_CONDITION, left + (width - inner_width) // 2, top + Inches(0.3),
+                             inner_width, inner_height, cell.condition)
+
+            else:
+                # Create a black dotted line oval for the extracted phrase
+                width, height = node_size(cell.phrase, DECISION.font_size, Inches(3), Inches(1.5), max_width)
+                page, left, top = layout.place(width, height)
+                pages.renderer(page).add(DECISION, left, top, width, height, cell.phrase)
 
         logger.info("script4 executed successfully")
+        return True
     except Exception as e:
         # Log any exceptions that occur
         logging.error(f'An error occurred in Script 2: {str(e)}')
+        return False
 
-def process_script5(filename_with_identifier, combined_presentation): # Script5: Seperate_verbs.py
-    filename_without_extension = os.path.splitext(filename_with_identifier)[0]
-    file_path = os.path.join(filename_with_identifier)
-    temp_csv_filename = filename_without_extension + '_verbs.csv'
+def process_script5(table, combined_presentation, analysis=None, index=None): # Script5: Seperate_verbs.py
     try:
         logger.info("Processing Script 5")
-        with open(file_path, 'r') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            rows = list(csv_reader)
-
-            # Remove first two rows
-            rows = rows[2:]
-            # Read the CSV file and extract verbs and their respective cells
-            # Extract verbs and non-empty cells from column D
-            data = []
-            for row in rows:
-                for i, cell in enumerate(row):
-                    if i == 0 or i == 5:
-                        continue   
-                    # Split the cell content into individual words
-                    words = word_tokenize(cell)
-                    # Part-of-speech tagging
-                    tagged_words = pos_tag(words)
-                    # Check if the cell contains a verb
-                    if any(tag.startswith('VB') for _, tag in tagged_words):
-                        data.append(('Verb', cell))
-                    # Extract non-empty data from column D
-                    if i == 3 and cell.strip():  # Check if cell is not empty
-                        data.append(('Column D', cell))
-        # Create a blank slide
+        # Tag and classify the cells now unless the shared stages already did
+        if analysis is None:
+            analysis = analyse_cells(process_row_cells(table))
+        if index is None:
+            index = CellIndex(table)
+        # Extract verbs and their respective cells, skipping the first two rows
+        # Extract verbs and non-empty cells from column D
+        data = []
+        for cell in index.process_cells():
+            # Check if the cell contains a verb
+            if analysis.get(cell.text).has_verb:
+                data.append(('Verb', cell.text))
+            # Extract non-empty data from column D
+            if cell.column == ACTIVITY_COLUMN and cell.text.strip():  # Check if cell is not empty
+                data.append(('Column D', cell.text))
+        # Create a blank slide, continued on more slides if the cells do not fit
         slide_layout = combined_presentation.slide_layouts[5]  # Blank slide layout
-        slide = combined_presentation.slides.add_slide(slide_layout)
+        pages = PagedSlides(combined_presentation, slide_layout)
+        pages.renderer(0)
             
-        # Calculate the positions to fit all cells within the slide
-        max_cells_per_row = 5
-        num_cells = len(data)
-        num_rows = (num_cells + max_cells_per_row - 1) // max_cells_per_row
+        # Cells run down the slide in columns as wide as their longest text
         cell_width = Inches(2.5)
         cell_height = Inches(0.5)
-        left_margin = Inches(0.5)
-        top_margin = Inches(1)
+        max_width = combined_presentation.slide_width - Inches(1)
+        layout = GridLayout(combined_presentation.slide_width, combined_presentation.slide_height,
+                            left_margin=Inches(0.5), top_margin=Inches(1), columns=True)
 
         # Create shapes in PowerPoint for data
-        left = left_margin
-        top = top_margin
         for row in data:
             cell_type, cell_content = row
-            if top + cell_height > Inches(10):
-                top = top_margin
-                left += cell_width
-            textbox = slide.shapes.add_textbox(left, top, cell_width, cell_height)
-            textbox.text_frame.text = cell_content
-            textbox.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER  # Center align text
-            top += cell_height
+            width, height = node_size(cell_content, VERB.font_size, cell_width, cell_height, max_width, ellipse=False)
+            page, left, top = layout.place(width, height)
+            pages.renderer(page).add(VERB, left, top, width, height, cell_content)  # Text centred in the box
         logger.info("script5 executed successfully")
+        return True
     except Exception as e:
         logging.error(f'An error occurred: {str(e)}')
-
-
-    # Main function
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 RunAll.py <filename>")
-        sys.exit(1)
-
-    filename_with_identifier = sys.argv[1]
-
-    process_script1(filename_with_identifier, combined_presentation)
-    process_script2(filename_with_identifier, combined_presentation)
-    process_script3(filename_with_identifier, combined_presentation)
-    process_script4(filename_with_identifier, combined_presentation)
-    process_script5(filename_with_identifier, combined_presentation)
+        return False
+
+
+def slide_dependencies(table, index):
+    """The part of the table each slide is built from, in deck order."""
+    return [
+        table.core_row,  # Script 1: core process statement
+        table.process_rows,  # Script 2: non-core process statements
+        index.sub_bubbles(),  # Script 3: words between parentheses
+        [cell.text for cell in index.decisions()],  # Script 4: decision bubbles
+        table.process_rows,  # Script 5: verbs
+    ]
+
+
+# Scripts in deck order, whether each one uses the NLP analysis and whether it uses the CellIndex
+# (script 1 lays the core process statement out by column position instead)
+SCRIPTS = [
+    (process_script1, True, False),
+    (process_script2, False, True),
+    (process_script3, False, True),
+    (process_script4, False, True),
+    (process_script5, True, True),
+]
+
+
+def slide_cache_keys(table, index):
+    """SlideCache key of each slide of the deck, in deck order."""
+    return [
+        slide_cache_key(output_version(), slide_number, dependencies)
+        for slide_number, dependencies in enumerate(slide_dependencies(table, index), start=1)
+    ]
+
+
+def render_slide(script_number, table, analysis=None, index=None):
+    """Run one script in a scratch presentation and return (succeeded, slide XMLs, stats).
+
+    There is one XML per slide the script added: its own slide, then any
+    continuation slides. stats holds the script's run time and shape count.
+    Runs in the process pool in parallel mode, so it only takes and returns
+    picklable values.
+    """
+    start = time.perf_counter()
+    presentation = Presentation()
+    script, uses_analysis, uses_index = SCRIPTS[script_number - 1]
+    inputs = {}
+    if uses_analysis:
+        inputs['analysis'] = analysis
+    if uses_index:
+        inputs['index'] = index
+    succeeded = script(table, presentation, **inputs)
+    xmls = tuple(slide_xml(slide) for slide in presentation.slides)
+    shapes = sum(len(slide.shapes) for slide in presentation.slides)
+    return succeeded, xmls, {'seconds': time.perf_counter() - start, 'shapes': shapes}
+
+
+def get_process_pool():
+    """Long-lived pool for the NLP-heavy scripts; each process loads the models once."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Spawn rather than fork, the web app forks from a process running threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=nlp_models.prewarm,
+            )
+        return _process_pool
+
+
+def discard_process_pool(pool):
+    """Drop a broken pool (a process died or its initializer failed); the next get_process_pool starts a new one."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def warm_process_pool():
+    """Start every pool process now so the first parallel job does not pay for it."""
+    pool = get_process_pool()
+    try:
+        futures = [pool.submit(nlp_models.resident_memory_mb) for _ in range(PROCESS_POOL_WORKERS)]
+        for future in futures:
+            future.result()
+    except BrokenProcessPool:
+        discard_process_pool(pool)
+        raise
+
+
+def render_slides_sequential(table, index, script_numbers, stages, progress):
+    # Tag every cell the slides need in one batched pass
+    analysis = None
+    if any(SCRIPTS[number - 1][1] for number in script_numbers):
+        start = time.perf_counter()
+        analysis = analyse_table(table)
+        stages['nlp'] = time.perf_counter() - start
+        logger.info(f"Analysed {len(analysis)} distinct cells")
+        progress('nlp')
+    results = {}
+    for number in script_numbers:
+        results[number] = render_slide(number, table, analysis, index)
+        progress(f'script{number}')
+    return results
+
+
+def render_slides_parallel(table, index, script_numbers, progress):
+    # Scripts 1 and 5 each tag and classify their own cells in the process pool...
+    pool = get_process_pool()
+    pooled = [number for number in script_numbers if SCRIPTS[number - 1][1]]
+    futures = {}
+    try:
+        for number in pooled:
+            futures[number] = pool.submit(render_slide, number, table)
+    except BrokenProcessPool:
+        pass
+    # ...while the layout-only scripts run here in the meantime
+    results = {}
+    for number in script_numbers:
+        if not SCRIPTS[number - 1][1]:
+            results[number] = render_slide(number, table, index=index)
+            progress(f'script{number}')
+    for number in pooled:
+        try:
+            if number not in futures:
+                raise BrokenProcessPool('The pool was already broken')
+            results[number] = futures[number].result()
+        except BrokenProcessPool as e:
+            # Build the slide here instead, and start a new pool for the next deck
+            logger.error(f"Slide process pool broken, building script {number} sequentially: {str(e)}")
+            discard_process_pool(pool)
+            results[number] = render_slide(number, table, index=index)
+        progress(f'script{number}')
+    return results
+
+
+def generate_presentation(table, output, slide_cache=None, parallel=False, timings=None, progress=None):
+    """Run all five scripts against one SIPOC table and save the combined deck.
+
+    output is a file path or a writable binary file, such as an in-memory or
+    spooled buffer that is handed to a result store afterwards.
+
+    With a SlideCache, slides whose part of the table is unchanged since an
+    earlier run are copied from the cache instead of being built again. With
+    parallel=True the scripts run concurrently and are assembled in deck order.
+    A timings dict, if given, is filled with the time and size of each stage,
+    and progress, if given, is called with the name of each stage (see
+    PIPELINE_STAGES) as soon as it completes.
+    """
+    if timings is None:
+        timings = {}
+    if progress is None:
+        progress = lambda stage: None
+    stages = timings.setdefault('stages', {})
+    shapes = timings.setdefault('shapes', {})
+    failed_scripts = timings.setdefault('failed_scripts', [])
+
+    # Classify every cell once for the cache keys and the slide builders
+    start = time.perf_counter()
+    index = CellIndex(table)
+    stages['index'] = time.perf_counter() - start
+    progress('index')
+
+    keys = slide_cache_keys(table, index)
+    slides = [slide_cache.get(key) if slide_cache else None for key in keys]
+    missing = [number for number, xml in enumerate(slides, start=1) if xml is None]
+    logger.info(f"Slides reused from cache: {len(slides) - len(missing)} of {len(slides)}")
+    timings['slides_cached'] = len(slides) - len(missing)
+    for number, xmls in enumerate(slides, start=1):
+        if xmls is not None:
+            progress(f'script{number}')
+
+    if parallel:
+        results = render_slides_parallel(table, index, missing, progress)
+    else:
+        results = render_slides_sequential(table, index, missing, stages, progress)
+    for number, (succeeded, xmls, stats) in sorted(results.items()):
+        slides[number - 1] = xmls
+        stages[f'script{number}'] = stats['seconds']
+        shapes[f'script{number}'] = stats['shapes']
+        # Only cache slides whose script finished without errors
+        if not succeeded:
+            failed_scripts.append(f'script{number}')
+        elif slide_cache is not None:
+            slide_cache.put(keys[number - 1], xmls)
+
+    # Assemble the slides into a single Presentation object in the original order
+    start = time.perf_counter()
+    combined_presentation = Presentation()
+    slide_layout = combined_presentation.slide_layouts[5]
+    for xmls in slides:
+        for xml in xmls:
+            add_slide_from_xml(combined_presentation, slide_layout, xml)
+    stages['assemble'] = time.perf_counter() - start
+    progress('assemble')
 
     # Save the combined presentation
-    combined_presentation_path = os.path.join(os.path.splitext(filename_with_identifier)[0] + '_combined.pptx')
-    combined_presentation.save(combined_presentation_path)
-    logger.info(f"Combined presentation saved successfully: {combined_presentation_path}")
-    print(f'All scripts have been executed and their outputs have been combined into one PowerPoint presentation: "{combined_presentation_path}"')
+    start = time.perf_counter()
+    combined_presentation.save(output)
+    stages['save'] = time.perf_counter() - start
+    progress('save')
+    if isinstance(output, str):
+        timings['output_bytes'] = os.path.getsize(output)
+    else:
+        # python-pptx leaves the buffer positioned at the end of the deck
+        timings['output_bytes'] = output.tell()
+    logger.info(f"Combined presentation saved successfully: {output if isinstance(output, str) else 'buffer'}")
+    return output
+
+
+def find_tables(paths):
+    """(table path, output path relative to the output directory) of every .csv/.xlsx in paths.
+
+    Directories are searched recursively and their layout is kept in the
+    output directory; Excel lock files (~$...) are skipped.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    if name.lower().endswith(TABLE_EXTENSIONS) and not name.startswith('~$'):
+                        table_path = os.path.join(directory, name)
+                        found.append((table_path, os.path.relpath(table_path, path)))
+        else:
+            found.append((path, os.path.basename(path)))
+    return found
+
+
+def deck_paths(tables, output_dir=None):
+    """(table path, deck path) for every (table path, relative path) from find_tables.
+
+    Decks go next to their table, or under output_dir keeping the relative
+    path. Tables that would write the same deck (x.csv and x.xlsx, or two
+    x.csv from different folders into one output_dir) get numbered decks,
+    x_2_combined.pptx and so on, instead of overwriting each other.
+    """
+    jobs = []
+    taken = set()
+    for table_path, relative_path in tables:
+        if output_dir:
+            stem = os.path.join(output_dir, os.path.splitext(relative_path)[0])
+        else:
+            stem = os.path.splitext(table_path)[0]
+        output_path = stem + '_combined.pptx'
+        number = 1
+        while os.path.normcase(os.path.abspath(output_path)) in taken:
+            number += 1
+            output_path = f"{stem}_{number}_combined.pptx"
+        if number > 1:
+            logger.warning(f"{stem}_combined.pptx is already written for another table, {table_path} goes to {output_path}")
+        taken.add(os.path.normcase(os.path.abspath(output_path)))
+        jobs.append((table_path, output_path))
+    return jobs
+
+
+def generate_file(table_path, output_path):
+    """Build the deck of one table file; return its timings, or the error that stopped it."""
+    start = time.perf_counter()
+    summary = {'file': table_path, 'output': output_path}
+    try:
+        if table_path.lower().endswith('.csv'):
+            table = SipocTable.from_csv(table_path)
+        elif table_path.lower().endswith('.xlsx'):
+            table = SipocTable.from_xlsx(table_path, source=table_path)
+        else:
+            raise ValueError('File must be a .csv or .xlsx table')
+        parse_seconds = time.perf_counter() - start
+
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        timings = {}
+        generate_presentation(table, output_path, timings=timings)
+        summary.update(
+            status='done',
+            rows=len(table),
+            parse_seconds=parse_seconds,
+            nlp_seconds=timings['stages'].get('nlp', 0.0),
+            failed_scripts=timings['failed_scripts'],
+            output_bytes=timings['output_bytes'],
+        )
+    except Exception as e:
+        logger.error(f"Could not generate {table_path}: {str(e)}")
+        summary.update(status='failed', error=str(e))
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def generate_files(jobs, workers=1):
+    """Run generate_file for every (table path, output path), in a process pool when workers > 1.
+
+    Yields the summaries as the files finish. Every pool process loads the
+    verb tagger once, before its first file.
+    """
+    if workers <= 1:
+        nlp_models.prewarm()
+        for table_path, output_path in jobs:
+            yield generate_file(table_path, output_path)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=nlp_models.prewarm,
+    ) as pool:
+        futures = [pool.submit(generate_file, table_path, output_path) for table_path, output_path in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate the combined deck of every SIPOC table (.csv or .xlsx) given, or found in the given directories.',
+    )
+    parser.add_argument('paths', nargs='+', help='table files and directories of them')
+    parser.add_argument('-o', '--output-dir',
+                        help='write the decks here (default: next to each table, as <name>_combined.pptx)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes generating decks in parallel (default: one per CPU)')
+    parser.add_argument('--json', action='store_true', help='print the per-file summary as JSON')
+    args = parser.parse_args()
+
+    jobs = deck_paths(find_tables(args.paths), args.output_dir)
+    if not jobs:
+        parser.error('no .csv or .xlsx tables found')
+
+    start = time.perf_counter()
+    summaries = []
+    for summary in generate_files(jobs, workers=min(args.workers, len(jobs))):
+        summaries.append(summary)
+        if not args.json:
+            if summary['status'] == 'done':
+                print(f"{summary['seconds']:8.2f}s  {summary['file']} -> {summary['output']}")
+            else:
+                print(f"  FAILED   {summary['file']}: {summary['error']}")
+    elapsed = time.perf_counter() - start
+
+    failed = sum(summary['status'] != 'done' for summary in summaries)
+    if args.json:
+        print(json.dumps({'files': summaries, 'failed': failed, 'seconds': elapsed}, indent=2))
+    else:
+        print(f"{len(summaries) - failed} of {len(summaries)} decks generated in {elapsed:.2f}s "
+              f"with {min(args.workers, len(jobs))} workers")
+    return 1 if failed else 0
+
 
-                  
+if __name__ == "__main__":
+    sys.exit(main())
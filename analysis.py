@@ -0,0 +1,81 @@
+import nlp_models
+import phrase_cache
+
+# Number of cells sent to the verb tagger per batch
+BATCH_SIZE = 256
+
+
+class CellAnalysis:
+    """Tokens and verbs found in one SIPOC cell."""
+
+    __slots__ = ('tokens', 'verbs', 'has_verb')
+
+    def __init__(self, tokens, verbs, has_verb):
+        self.tokens = tokens  # Every token in the cell
+        self.verbs = verbs  # Tokens tagged VERB (used by the core process statement slide)
+        self.has_verb = has_verb  # Any VB* tag, auxiliaries included (used by the verbs slide)
+
+
+# Result for blank cells, which never need to go through the model
+EMPTY_ANALYSIS = CellAnalysis([], [], False)
+
+
+class TableAnalysis:
+    """Analysis of every cell the slide builders need, looked up by cell text."""
+
+    def __init__(self, results):
+        self._results = results
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, cell):
+        if not cell.strip():
+            return EMPTY_ANALYSIS
+        result = self._results.get(cell)
+        if result is None:
+            # The cell was not part of the batch, analyse it on its own
+            result = analyse_cells([cell])._results[cell]
+            self._results[cell] = result
+        return result
+
+
+def analyse_cells(cells, batch_size=BATCH_SIZE):
+    """Tag all cells in one batched pass; identical cells are only tagged once.
+
+    Cells differing only in whitespace count as identical, and cells tagged by
+    an earlier job (in any process sharing the phrase cache) are not tagged again.
+    """
+    tagger = nlp_models.get_verb_tagger()
+    tagger_key = f"{tagger.name}:{tagger.version}"
+    phrases = {cell: phrase_cache.normalize(cell) for cell in dict.fromkeys(cells) if cell.strip()}
+    unique_phrases = list(dict.fromkeys(phrases.values()))
+
+    cache = phrase_cache.get_phrase_cache()
+    analyses = cache.get_many(tagger_key, unique_phrases) if cache is not None else {}
+    missing = [phrase for phrase in unique_phrases if phrase not in analyses]
+    tagged = dict(zip(missing, tagger.analyse(missing, batch_size=batch_size)))
+    if cache is not None:
+        cache.put_many(tagger_key, tagged)
+    analyses.update(tagged)
+
+    results = {}
+    for cell, phrase in phrases.items():
+        tokens, verbs, has_verb = analyses[phrase]
+        results[cell] = CellAnalysis(tokens, verbs, has_verb)
+    return TableAnalysis(results)
+
+
+def core_row_cells(table):
+    """Cells tagged for the core process statement slide: second row, ignoring column D."""
+    return [cell for i, cell in enumerate(table.core_row) if i != 3]
+
+
+def process_row_cells(table):
+    """Cells tagged for the verbs slide: remaining rows, ignoring columns A and F."""
+    return [cell for row in table.process_rows for i, cell in enumerate(row) if i not in (0, 5)]
+
+
+def analyse_table(table):
+    """Analyse the cells used by the core process statement and verbs slides."""
+    return analyse_cells(core_row_cells(table) + process_row_cells(table))
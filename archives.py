@@ -0,0 +1,101 @@
+import io
+import os
+import zipfile
+from collections import namedtuple
+
+
+class WorkbookEntry(namedtuple('WorkbookEntry', ('filename', 'unpacked_bytes', 'open', 'error'))):
+    """One workbook of a batch upload, listed without reading it.
+
+    open() returns the workbook as a file object, unpacking it from its zip
+    archive only then; it is None for files that cannot be used, whose error
+    says why. unpacked_bytes is what unpacking will take, 0 for workbooks
+    uploaded as they are.
+    """
+
+    __slots__ = ()
+
+
+def _member_opener(archive, info):
+    return lambda: io.BytesIO(archive.read(info))
+
+
+def list_workbooks(uploads, max_member_bytes=None):
+    """WorkbookEntry of every workbook in the uploaded files, reading only the zip directories.
+
+    Zip archives are listed member by member. Files that cannot be used are
+    listed with an error message, so they can still be reported back per
+    file. Workbooks that would unpack to more than max_member_bytes are
+    refused. Callers check the number and total size of the entries before
+    opening any of them.
+    """
+    entries = []
+    for upload in uploads:
+        if upload.filename.lower().endswith('.zip'):
+            try:
+                # Left open for the openers; it reads from the request's upload stream
+                archive = zipfile.ZipFile(upload.stream)
+            except zipfile.BadZipFile:
+                entries.append(WorkbookEntry(upload.filename, 0, None, 'File is not a valid zip archive'))
+                continue
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                # Skip folders, macOS metadata and Excel lock files
+                if info.is_dir() or info.filename.startswith('__MACOSX/') or name.startswith('~$'):
+                    continue
+                if not name.lower().endswith('.xlsx'):
+                    entries.append(WorkbookEntry(info.filename, 0, None, 'File must be in Excel format (.xlsx)'))
+                elif max_member_bytes is not None and info.file_size > max_member_bytes:
+                    entries.append(WorkbookEntry(
+                        info.filename, 0, None, f'Workbook is larger than {max_member_bytes // (1024 * 1024)} MB'
+                    ))
+                else:
+                    entries.append(WorkbookEntry(info.filename, info.file_size, _member_opener(archive, info), None))
+        elif upload.filename.lower().endswith('.xlsx'):
+            entries.append(WorkbookEntry(upload.filename, 0, lambda stream=upload.stream: stream, None))
+        else:
+            entries.append(WorkbookEntry(upload.filename, 0, None, 'File must be in Excel format (.xlsx) or a zip of them'))
+    return entries
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable file that collects what zipfile writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, chunk_size=1024 * 1024):
+    """Yield a zip archive of (name in archive, content) entries piece by piece.
+
+    content is bytes, a file path, or a function returning an open binary file,
+    which is only called when the entry is reached. The archive is never held
+    in memory or written to disk as a whole. Decks are zip files already, so
+    entries are stored without compressing them again.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, content in entries:
+            if isinstance(content, bytes):
+                archive.writestr(name, content)
+            else:
+                source = content() if callable(content) else open(content, 'rb')
+                with source, archive.open(name, 'w') as target:
+                    for chunk in iter(lambda: source.read(chunk_size), b''):
+                        target.write(chunk)
+                        yield buffer.drain()
+            yield buffer.drain()
+    # The central directory is written when the archive is closed
+    yield buffer.drain()
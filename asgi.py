@@ -0,0 +1,301 @@
+"""ASGI entry point for the PrOH Tool, e.g. `uvicorn asgi:app --workers 1`.
+
+Request bodies are received on the event loop, so a slow upload costs no
+thread until it has fully arrived. The Flask app then runs in a thread pool:
+workbook uploads (/upload and /batch) get their own small pool, because
+parsing a large workbook is CPU work, and every other request (job status,
+downloads, /metrics) gets the request pool. However many big workbooks are
+being parsed, status polls and downloads are still answered straight away.
+Progress streams (/jobs/<id>/events) wait for job events on the event loop
+itself, so any number of open streams holds no thread at all. Decks are
+generated by the job queue's workers as before.
+
+Configuration:
+    PROH_ASGI_REQUEST_THREADS  threads for ordinary requests (default 16)
+    PROH_ASGI_INGEST_THREADS   threads parsing uploaded workbooks (default 2)
+
+Run a single worker process (jobs are tracked in memory by the process that
+accepted the upload), either with uvicorn directly:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 1
+or under gunicorn with gunicorn.conf.py:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from flask import url_for
+
+import metrics
+from jobs import JOB_DONE, JOB_FAILED
+from main import app as flask_app, job_queue, last_event_id, event_message, EVENTS_HEADERS, EVENTS_RETRY
+
+REQUEST_THREADS = int(os.environ.get('PROH_ASGI_REQUEST_THREADS', 16))
+INGEST_THREADS = int(os.environ.get('PROH_ASGI_INGEST_THREADS', 2))
+
+# Requests whose handling is dominated by parsing uploaded workbooks
+INGEST_PATHS = ('/upload', '/batch')
+# Progress streams, served on the event loop by _job_events instead of by the Flask app
+EVENTS_PATH = re.compile(r'/jobs/([^/]+)/events')
+
+# Request bodies stay in memory up to this size, larger ones spill to a temporary file
+BODY_SPOOL_BYTES = 1024 * 1024
+
+_request_executor = ThreadPoolExecutor(max_workers=REQUEST_THREADS, thread_name_prefix='asgi-request')
+_ingest_executor = ThreadPoolExecutor(max_workers=INGEST_THREADS, thread_name_prefix='asgi-ingest')
+
+# Returned by _next_chunk once the response body is exhausted
+_END = object()
+# Returned by _receive_body for bodies over MAX_CONTENT_LENGTH
+_TOO_LARGE = object()
+
+
+def _wsgi_environ(scope, body, content_length):
+    """WSGI environ (PEP 3333) of an ASGI HTTP request whose body of content_length bytes has been received."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        # Repeated headers are joined, as WSGI servers do
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    # The body is complete, so Flask reads it by its length even when it arrived in chunks
+    environ['CONTENT_LENGTH'] = str(content_length)
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    return environ
+
+
+def _next_chunk(iterator):
+    try:
+        return next(iterator)
+    except StopIteration:
+        return _END
+
+
+def _start_wsgi(environ):
+    """Call the Flask app; return its start_response arguments and the response body iterable."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = status
+        response['headers'] = headers
+        return response.setdefault('written', []).append
+
+    body = flask_app(environ, start_response)
+    return response, body
+
+
+async def _receive_body(receive, max_length=None):
+    """Read the whole request body from the client without blocking a thread.
+
+    Stops reading as soon as the body grows past max_length, which catches
+    chunked uploads that declare no Content-Length. Returns the body and its size.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        if max_length is not None and body.tell() > max_length:
+            body.close()
+            return _TOO_LARGE
+        if not message.get('more_body'):
+            size = body.tell()
+            body.seek(0)
+            return body, size
+
+
+async def _send_error(send, status, error):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'connection', b'close')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(error).encode('utf-8')})
+
+
+async def _send_too_large(send, max_length):
+    # Same body as the Flask app's 413 handler
+    metrics.upload_rejections_total.inc(reason='too_large')
+    await _send_error(send, 413, {'error': f"The upload is larger than {max_length // (1024 * 1024)} MB",
+                                  'code': 'too_large', 'max_bytes': max_length})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _job_events(scope, receive, send, job_id):
+    """Server-sent events of a job, as main.job_events sends them, waiting on the event loop.
+
+    The job calls back into the loop when it adds an event, so a stream costs
+    no thread however long it stays open, and it stays open until the job
+    finishes, the client disconnects or EVENTS_STREAM_SECONDS pass.
+    """
+    loop = asyncio.get_running_loop()
+    job = job_queue.get(job_id)
+    if job is None:
+        await _send_error(send, 404, {'error': 'Job not found.'})
+        return
+
+    headers = dict(scope.get('headers', []))
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    after = last_event_id(headers.get(b'last-event-id', b'').decode('latin-1'), query.get('after', [None])[0])
+    # Built like the Flask app builds it, so it honours the root path
+    with flask_app.request_context(_wsgi_environ(scope, io.BytesIO(), 0)):
+        result_url = url_for('job_result', job_id=job.id)
+
+    changed = asyncio.Event()
+
+    def notify():
+        # Runs in the job worker's thread
+        loop.call_soon_threadsafe(changed.set)
+
+    job.add_listener(notify)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        response_headers = [(b'content-type', b'text/event-stream; charset=utf-8')]
+        response_headers += [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                             for name, value in EVENTS_HEADERS.items()]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': EVENTS_RETRY.encode('utf-8'), 'more_body': True})
+
+        deadline = loop.time() + flask_app.config['EVENTS_STREAM_SECONDS']
+        finished = False
+        while not finished and not disconnected.done():
+            # Cleared before reading, so an event added in between still wakes the wait below
+            changed.clear()
+            events = job.events_after(after)
+            for event in events:
+                after = event['id']
+                await send({'type': 'http.response.body', 'body': event_message(event, result_url).encode('utf-8'),
+                            'more_body': True})
+                finished = event['event'] in (JOB_DONE, JOB_FAILED)
+            if events:
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            waiter = asyncio.ensure_future(changed.wait())
+            done, _ = await asyncio.wait({waiter, disconnected}, timeout=min(remaining, 10),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if not done:
+                # Comment line, keeps proxies from timing the connection out
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        job.remove_listener(notify)
+        disconnected.cancel()
+
+
+async def _http(scope, receive, send):
+    loop = asyncio.get_running_loop()
+
+    events_path = EVENTS_PATH.fullmatch(scope['path'])
+    if scope['method'] == 'GET' and events_path:
+        await _job_events(scope, receive, send, events_path.group(1))
+        return
+
+    # Refuse oversized uploads before receiving them, with the limit Flask would apply
+    max_length = flask_app.config.get('MAX_CONTENT_LENGTH')
+    for name, value in scope.get('headers', []):
+        if name != b'content-length':
+            continue
+        try:
+            declared_length = int(value)
+        except ValueError:
+            declared_length = -1
+        if declared_length < 0:
+            await _send_error(send, 400, {'error': 'Invalid Content-Length header', 'code': 'bad_request'})
+            return
+        if max_length is not None and declared_length > max_length:
+            await _send_too_large(send, max_length)
+            return
+
+    received = await _receive_body(receive, max_length)
+    if received is None:
+        # The client went away before sending the whole request
+        return
+    if received is _TOO_LARGE:
+        await _send_too_large(send, max_length)
+        return
+    body, content_length = received
+
+    ingest = scope['method'] == 'POST' and scope['path'] in INGEST_PATHS
+    executor = _ingest_executor if ingest else _request_executor
+    with body:
+        response, iterable = await loop.run_in_executor(executor, _start_wsgi, _wsgi_environ(scope, body, content_length))
+        iterator = iter(iterable)
+        try:
+            status = int(response['status'].split(' ', 1)[0])
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in response['headers']]
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            for data in response.get('written', []):
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+            # Streamed bodies (decks, batch archives) are read piece by piece in the request
+            # pool, so a finished upload's response never waits behind other uploads' parsing
+            while True:
+                chunk = await loop.run_in_executor(_request_executor, _next_chunk, iterator)
+                if chunk is _END:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(_request_executor, iterable.close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _request_executor.shutdown(wait=False)
+            _ingest_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http':
+        await _http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    else:
+        raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
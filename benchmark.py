@@ -0,0 +1,234 @@
+"""Benchmark the upload-to-deck pipeline on synthetic SIPOC tables.
+
+Usage: python3 benchmark.py --rows 200 --repeat 5 --output bench.json
+
+Each stage is timed separately (workbook parse, CSV parse, NLP, every
+process_script*, assembly and Presentation.save), then the whole pipeline and
+the Flask /upload path through the test client. Results are written as JSON.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HEADINGS = [
+    'PREVIOUS KEY HUMAN RESOURCE AND ACTIVITY',
+    'INPUT',
+    'KEY HUMAN RESOURCE',
+    'PERFORMS AN ACTIVITY',
+    'OUTPUT',
+    'NEXT HUMAN RESOURCE AND ACTIVITY',
+]
+VERBS = ['produces', 'evaluates', 'creates', 'delivers', 'finalises', 'discusses', 'receives', 'approves', 'checks', 'sends']
+NOUNS = ['order', 'furniture', 'material', 'quantity', 'design', 'capacity', 'notification', 'works order', 'bid decision', 'delivery time']
+ROLES = ['Customer', 'Factory', 'Commercial Director', 'Production manager', 'Retailer', 'Operator', 'Supplier']
+
+
+def synthetic_rows(rows=50, words_per_cell=4, decisions=5, sub_bubbles=10, seed=0):
+    """Rows of a SIPOC table: headings, core process statement, then `rows` process steps.
+
+    `decisions` cells in column E start with "OR:" and `sub_bubbles`
+    parenthesised words are spread over columns B-E.
+    """
+    rng = random.Random(seed)
+
+    def phrase():
+        words = [rng.choice(ROLES), rng.choice(VERBS)]
+        while len(words) < words_per_cell:
+            words.append(rng.choice(NOUNS))
+        return ' '.join(words)
+
+    table = [list(HEADINGS), [phrase() for _ in range(6)]]
+    for _ in range(rows):
+        table.append([phrase() for _ in range(6)])
+
+    for _ in range(decisions):
+        row = rng.randrange(2, len(table))
+        table[row][4] = f"OR: {rng.choice(NOUNS)} ({rng.choice(['accept', 'reject', 'hold'])})"
+    for _ in range(sub_bubbles):
+        row = rng.randrange(1, len(table))
+        column = rng.randrange(1, 5)
+        table[row][column] += f" ({rng.choice(NOUNS)})"
+    return table
+
+
+def xlsx_bytes(rows):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': statistics.mean(samples) * 1000,
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': ordered[0] * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def run(args):
+    # Work in a scratch directory, removed afterwards: the app writes app.log, uploads/ and its caches
+    # to the current directory
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='proh_bench_') as bench_dir:
+        os.chdir(bench_dir)
+        try:
+            return run_stages(args, bench_dir)
+        finally:
+            os.chdir(previous_dir)
+
+
+def run_stages(args, bench_dir):
+    os.makedirs('uploads', exist_ok=True)
+    sys.path.insert(0, REPO_DIR)
+    if not args.phrase_cache:
+        # Every repeat tags the same cells, a phrase cache would only time the first one
+        os.environ['PROH_PHRASE_CACHE'] = ''
+
+    import RunAll
+    import nlp_models
+    from analysis import analyse_table
+    from cell_index import CellIndex
+    from pptx import Presentation
+    from sipoc import SipocTable
+    from slide_cache import add_slide_from_xml
+
+    rows = synthetic_rows(args.rows, args.words_per_cell, args.decisions, args.sub_bubbles, args.seed)
+    workbook = xlsx_bytes(rows)
+    csv_path = os.path.join(bench_dir, 'synthetic.csv')
+    with open(csv_path, 'w', newline='') as csv_file:
+        csv.writer(csv_file).writerows(rows)
+
+    # Model loading is a one-off per worker, keep it out of the per-stage numbers
+    warm = nlp_models.prewarm()
+
+    samples = {}
+
+    def timed(stage, function, *function_args, **function_kwargs):
+        start = time.perf_counter()
+        result = function(*function_args, **function_kwargs)
+        samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    for _ in range(args.repeat):
+        table = timed('excel_parse', SipocTable.from_xlsx, io.BytesIO(workbook))
+        timed('csv_parse', SipocTable.from_csv, csv_path)
+        index = timed('index', CellIndex, table)
+        analysis = timed('nlp', analyse_table, table)
+        slides = []
+        for number in range(1, len(RunAll.SCRIPTS) + 1):
+            succeeded, xmls, stats = timed(f'script{number}', RunAll.render_slide, number, table, analysis, index)
+            slides.extend(xmls)
+
+        def assemble():
+            presentation = Presentation()
+            for xml in slides:
+                add_slide_from_xml(presentation, presentation.slide_layouts[5], xml)
+            return presentation
+
+        presentation = timed('assemble', assemble)
+        output = io.BytesIO()
+        timed('save', presentation.save, output)
+        timed('generate_total', RunAll.generate_presentation, table, os.path.join(bench_dir, 'deck.pptx'),
+              parallel=args.parallel)
+
+    results = {
+        'config': vars(args),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'generator_version': RunAll.GENERATOR_VERSION,
+            'verb_tagger': nlp_models.VERB_TAGGER,
+            'phrase_cache': args.phrase_cache,
+            'model_prewarm': warm,
+        },
+        'output_bytes': len(output.getvalue()),
+        'stages': {stage: summarize(values) for stage, values in samples.items()},
+    }
+    if not args.skip_upload:
+        results['stages'].update(benchmark_upload(workbook, args))
+    return results
+
+
+def benchmark_upload(workbook, args):
+    """Time POST /upload and upload-until-deck-ready through the Flask test client."""
+    import main
+
+    # Every repeat uploads the same table, so turn the caches off to time real generations
+    main.job_queue.cache = None
+    main.job_queue.slide_cache = None
+    main.job_queue.parallel_slides = args.parallel
+    client = main.app.test_client()
+
+    request_samples = []
+    total_samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        response = client.post('/upload', data={'file': (io.BytesIO(workbook), 'synthetic.xlsx')})
+        request_samples.append(time.perf_counter() - start)
+        if response.status_code != 202:
+            raise RuntimeError(f"/upload returned {response.status_code}: {response.get_data(as_text=True)}")
+
+        status_url = response.get_json()['status_url']
+        while True:
+            status = client.get(status_url).get_json()
+            if status['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.01)
+        total_samples.append(time.perf_counter() - start)
+        if status['status'] == 'failed':
+            raise RuntimeError(f"Upload job failed: {status['error']}")
+
+    return {
+        'upload_request': summarize(request_samples),
+        'upload_to_deck': summarize(total_samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50, help='process steps after the core process statement')
+    parser.add_argument('--words-per-cell', type=int, default=4)
+    parser.add_argument('--decisions', type=int, default=5, help='number of OR: decision cells')
+    parser.add_argument('--sub-bubbles', type=int, default=10, help='number of parenthesised words')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--parallel', action='store_true', help='build slides in parallel mode')
+    parser.add_argument('--skip-upload', action='store_true', help='do not benchmark the Flask /upload path')
+    parser.add_argument('--phrase-cache', action='store_true',
+                        help='keep the phrase cache on (starting empty), so repeats after the first reuse the tags')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+    # Relative to where the benchmark was started, not the scratch directory
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    results = run(args)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import re
+
+# Kinds of cell
+ACTIVITY = 'activity'  # Columns A, B, D, E and F: what is done or passed on
+RESOURCE = 'resource'  # Column C: who does it
+DECISION = 'decision'  # "OR: <phrase>" in columns B-E
+DECISION_WITH_CONDITION = 'decision_with_condition'  # "OR: <phrase> (<condition>)" in columns B-E
+ANNOTATION = 'annotation'  # Any other cell with words between parentheses
+
+# Column numbers, see sipoc.COLUMN_NAMES
+PREVIOUS_COLUMN, INPUT_COLUMN, RESOURCE_COLUMN, ACTIVITY_COLUMN, OUTPUT_COLUMN, NEXT_COLUMN = range(6)
+# Columns B-E; decisions and sub-bubbles are only looked for there
+INNER_COLUMNS = (INPUT_COLUMN, RESOURCE_COLUMN, ACTIVITY_COLUMN, OUTPUT_COLUMN)
+
+# Words between parentheses, i.e. everything between '(' and ')', are drawn as sub-bubbles
+SUB_BUBBLE_PATTERN = re.compile(r'\(([^)]*)\)')
+
+
+def parse_decision(text):
+    """(phrase, condition) of a decision cell "OR: <phrase> (<condition>)"; condition is None without one.
+
+    Only the first '(' separates the phrase from the condition, and the last
+    character of the cell is taken to be the closing ')'.
+    """
+    phrase = text[3:].strip()
+    if '(' in phrase and ')' in phrase:
+        main_phrase, inner_phrase = phrase.split('(', 1)
+        return main_phrase.strip(), inner_phrase[:-1].strip()
+    return phrase, None
+
+
+def classify_cell(text, column):
+    """Kind of a cell with this text in this column."""
+    if column in INNER_COLUMNS and text.lower().startswith('or:'):
+        return DECISION if parse_decision(text)[1] is None else DECISION_WITH_CONDITION
+    if '(' in text:
+        return ANNOTATION
+    return RESOURCE if column == RESOURCE_COLUMN else ACTIVITY
+
+
+class IndexedCell:
+    """One non-empty cell of the table, with its kind and the phrases the slides draw from it."""
+
+    __slots__ = ('row', 'column', 'text', 'kind', 'phrase', 'condition', 'sub_bubbles')
+
+    def __init__(self, row, column, text):
+        self.row = row  # Index into SipocTable.rows
+        self.column = column  # 0 for column A ... 5 for column F
+        self.text = text
+        self.kind = classify_cell(text, column)
+        if self.kind in (DECISION, DECISION_WITH_CONDITION):
+            self.phrase, self.condition = parse_decision(text)
+        else:
+            self.phrase, self.condition = text, None
+        self.sub_bubbles = SUB_BUBBLE_PATTERN.findall(text)
+
+    @property
+    def annotated(self):
+        """Whether the cell holds an opening parenthesis, which keeps it off the process statement slide."""
+        return '(' in self.text
+
+    def __repr__(self):
+        return f"IndexedCell(row={self.row}, column={self.column}, kind={self.kind!r}, text={self.text!r})"
+
+
+class CellIndex:
+    """Every non-empty cell of a table, classified in one pass over the rows.
+
+    The slide builders select the cells they draw from here instead of
+    scanning the table with their own tests, so each cell is lowercased,
+    split and regex-matched once per table rather than once per builder.
+    """
+
+    def __init__(self, table):
+        self.cells = [
+            IndexedCell(row_number, column, cell)
+            for row_number, row in enumerate(table.rows)
+            for column, cell in enumerate(row)
+            if cell
+        ]
+
+    def __len__(self):
+        return len(self.cells)
+
+    def process_cells(self, columns=INNER_COLUMNS):
+        """Cells of the process step rows (after the core process statement) in the given columns, in table order."""
+        return [cell for cell in self.cells if cell.row >= 2 and cell.column in columns]
+
+    def statements(self):
+        """Cells of the non-core process statement slide: columns B, C and E of the process steps, unannotated."""
+        return [cell for cell in self.process_cells((INPUT_COLUMN, RESOURCE_COLUMN, OUTPUT_COLUMN)) if not cell.annotated]
+
+    def decisions(self):
+        """Decision cells of every row, in table order."""
+        return [cell for cell in self.cells if cell.kind in (DECISION, DECISION_WITH_CONDITION)]
+
+    def sub_bubbles(self):
+        """Each word between parentheses in columns B-E once, in the order it first appears."""
+        return list(dict.fromkeys(
+            word for cell in self.cells if cell.column in INNER_COLUMNS for word in cell.sub_bubbles
+        ))
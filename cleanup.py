@@ -0,0 +1,155 @@
+"""Retention of generated files in the uploads directory.
+
+Usage: python3 cleanup.py --max-age-hours 24 --max-mb 1000 [--dry-run]
+
+Finished decks in the result store and files left in uploads/ by uploads
+(workbooks, sub-bubble CSVs and decks of earlier versions) are removed once
+older than the TTL, then least recently used first until under the size
+quota. The deck cache in uploads/cache evicts its own entries.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import metrics
+
+# Create a logger instance (shared with RunAll.py)
+logger = logging.getLogger('merged_logger')
+
+# Files written for an upload: <name>_<8 hex id>[_<batch index>] plus what each kind adds
+GENERATED_FILE = re.compile(r'_[0-9a-f]{8}(_\d+)?(\.xlsx|\.csv|_combined\.pptx|_subbubbles\.csv)$')
+
+
+class CleanupService:
+    """Removes expired and least recently used generated files, once or on a background thread.
+
+    in_flight, if given, returns the file name prefixes of queued and running
+    jobs; their files are never removed. Files younger than min_age_seconds are
+    kept as well, which protects jobs of other processes that in_flight cannot see.
+    prune_jobs, if given, is called with max_age_seconds on every run so the
+    job queue forgets finished jobs along with their files.
+    """
+
+    def __init__(self, uploads_dir, results_dir, max_age_seconds=24 * 3600, max_bytes=1024 * 1024 * 1024,
+                 min_age_seconds=600, interval_seconds=600, in_flight=None, prune_jobs=None):
+        self.uploads_dir = uploads_dir
+        self.results_dir = results_dir
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self.interval_seconds = interval_seconds
+        self.in_flight = in_flight
+        self.prune_jobs = prune_jobs
+        self._lock = threading.Lock()  # One pass at a time
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def _candidates(self):
+        """(last used, size, path) of every file the service may remove."""
+        paths = []
+        if os.path.isdir(self.results_dir):
+            paths.extend(os.path.join(self.results_dir, name) for name in os.listdir(self.results_dir))
+        if os.path.isdir(self.uploads_dir):
+            paths.extend(
+                os.path.join(self.uploads_dir, name) for name in os.listdir(self.uploads_dir)
+                if GENERATED_FILE.search(name)
+            )
+
+        candidates = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                # The result store records downloads in the access time
+                candidates.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+        return candidates
+
+    def run_once(self, dry_run=False):
+        """Apply the TTL and the size quota once and return what was removed."""
+        with self._lock:
+            now = time.time()
+            protected = tuple(self.in_flight()) if self.in_flight else ()
+            candidates = sorted(self._candidates())  # Least recently used first
+            total_bytes = sum(size for _, size, _ in candidates)
+
+            summary = {'removed_files': 0, 'reclaimed_bytes': 0, 'remaining_bytes': total_bytes}
+            for last_used, size, path in candidates:
+                if now - last_used > self.max_age_seconds:
+                    reason = 'expired'
+                elif total_bytes > self.max_bytes:
+                    reason = 'quota'
+                else:
+                    continue
+                if now - last_used < self.min_age_seconds or os.path.basename(path).startswith(protected):
+                    continue
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    metrics.cleanup_removed_files_total.inc(reason=reason)
+                    metrics.cleanup_reclaimed_bytes_total.inc(size, reason=reason)
+                total_bytes -= size
+                summary['removed_files'] += 1
+                summary['reclaimed_bytes'] += size
+
+            summary['remaining_bytes'] = total_bytes
+            if self.prune_jobs is not None and not dry_run:
+                summary['forgotten_jobs'] = self.prune_jobs(self.max_age_seconds)
+            if summary['removed_files']:
+                logger.info(f"Cleanup {'would remove' if dry_run else 'removed'} {summary['removed_files']} files, "
+                            f"{summary['reclaimed_bytes']} bytes")
+            return summary
+
+    def start(self):
+        """Run the cleanup every interval_seconds on a daemon thread."""
+        # Called before every request, so the usual case returns without taking a lock
+        if self._thread is not None or not self.interval_seconds:
+            return
+        # Not the pass lock, which a running pass holds for as long as it takes
+        with self._start_lock:
+            if self._thread is not None or not self.interval_seconds:
+                return
+            self._thread = threading.Thread(target=self._loop, name="uploads-cleanup", daemon=True)
+            self._thread.start()
+        logger.info(f"Uploads cleanup started, every {self.interval_seconds}s")
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                # Try again at the next interval
+                logger.error(f"Uploads cleanup failed: {str(e)}")
+            time.sleep(self.interval_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uploads-dir', default=os.environ.get('PROH_UPLOADS_DIR', 'uploads'))
+    parser.add_argument('--results-dir', default=os.environ.get('PROH_RESULT_DIR', os.path.join('uploads', 'results')))
+    parser.add_argument('--max-age-hours', type=float, default=float(os.environ.get('PROH_RETENTION_HOURS', 24)))
+    parser.add_argument('--max-mb', type=int, default=int(os.environ.get('PROH_RETENTION_MAX_MB', 1000)))
+    parser.add_argument('--min-age-minutes', type=float, default=10,
+                        help='never remove younger files, which may belong to running jobs')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    args = parser.parse_args()
+
+    service = CleanupService(
+        args.uploads_dir,
+        args.results_dir,
+        max_age_seconds=args.max_age_hours * 3600,
+        max_bytes=args.max_mb * 1024 * 1024,
+        min_age_seconds=args.min_age_minutes * 60,
+    )
+    print(json.dumps(service.run_once(dry_run=args.dry_run), indent=2))
+
+
+if __name__ == "__main__":
+    main()
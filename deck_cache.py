@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+# Create a logger instance (shared with RunAll.py)
+logger = logging.getLogger('merged_logger')
+
+
+def cache_key(table, generator_version):
+    """Key of the deck generated from this table by this version of the generator."""
+    return hashlib.sha256(f"{generator_version}:{table.fingerprint()}".encode('utf-8')).hexdigest()
+
+
+class DeckCache:
+    """Generated decks stored on disk under the hash of the table they were built from.
+
+    Entries older than max_age_seconds are dropped, and once the directory grows
+    past max_bytes the least recently used decks are removed first.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024, max_age_seconds=72 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pptx")
+
+    def get(self, key):
+        """Path of the cached deck for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age <= self.max_age_seconds:
+                # Mark the entry as recently used for LRU eviction
+                os.utime(path)
+        except OSError:
+            # Missing, or evicted by another process in the meantime
+            age = None
+
+        with self._lock:
+            if age is None or age > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        logger.info(f"Deck cache hit for {key}")
+        return path
+
+    def put(self, key, deck):
+        """Copy a freshly generated deck (a binary file object) into the cache and return its cached path."""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as target:
+            shutil.copyfileobj(deck, target)
+        # Atomic, so readers never see a half-written deck
+        os.replace(temp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove expired entries, then least recently used ones until under max_bytes."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pptx'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        # Oldest first
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age_seconds and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+
+        if removed:
+            with self._lock:
+                self.evictions += removed
+            logger.info(f"Deck cache evicted {removed} entries")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,43 @@
+# Gunicorn configuration for the PrOH Tool, e.g. `gunicorn -c gunicorn.conf.py main:app`
+# or, for the async serving mode described in asgi.py,
+# `GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app`
+import os
+
+import nlp_models
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Jobs are tracked in memory by the worker that accepted the upload, so keep a
+# single worker process and scale with threads instead. Decks are generated in
+# PROH_JOB_WORKERS job processes of their own, so raise that to use more cores.
+# With gthread, every browser watching a job's progress (/jobs/<id>/events) holds
+# a thread for up to PROH_EVENTS_POLL_SECONDS at a time, so allow roughly one
+# thread per user expected to be waiting on a deck at once, plus a few for
+# uploads, polls and downloads. The uvicorn worker serves those streams without
+# holding any thread.
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# gthread by default; with uvicorn workers `threads` is unused and the request and
+# upload thread pools are set with PROH_ASGI_REQUEST_THREADS and PROH_ASGI_INGEST_THREADS
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Load the app (and, with PROH_PRELOAD_MODELS=1, the NLP models) in the master
+# process so forked workers share the memory pages copy-on-write.
+preload_app = os.environ.get('PROH_PRELOAD_MODELS') == '1'
+# The web workers only use the models when decks are generated in threads (PROH_JOB_PROCESSES=0);
+# job processes load their own
+models_in_workers = os.environ.get('PROH_JOB_PROCESSES', '1') == '0'
+
+
+def on_starting(server):
+    if preload_app and models_in_workers:
+        stats = nlp_models.prewarm()
+        server.log.info(f"Models pre-warmed in master: {stats}")
+
+
+def post_fork(server, worker):
+    if not models_in_workers:
+        return
+    # No-op if the models were already loaded in the master
+    stats = nlp_models.prewarm()
+    server.log.info(f"Worker {worker.pid} ready: {stats}")
@@ -0,0 +1,450 @@
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import RunAll
+import metrics
+import nlp_models
+from cell_index import CellIndex
+from deck_cache import cache_key
+from result_store import MemoryResultStore
+
+# Create a logger instance (shared with RunAll.py)
+logger = logging.getLogger('merged_logger')
+
+# Define job status constants
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Decks are saved into memory and only spill to a temporary file past this size
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+
+class Job:
+    """One deck generation request waiting in, or taken from, the job queue."""
+
+    def __init__(self, table, filename, timings=None):
+        self.id = uuid.uuid4().hex
+        self.table = table
+        # Files written for an upload are named after its source, see cleanup.GENERATED_FILE
+        self.source = table.source
+        # Name the deck is downloaded as; the deck itself is kept in the result store under the job id
+        self.filename = filename
+        # Time and size of each pipeline stage, see RunAll.generate_presentation
+        self.timings = timings if timings is not None else {}
+        self.status = JOB_QUEUED
+        self.error = None
+        self.cache_key = None
+        self.cached = False  # True when the deck came from the deck cache
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Progress events, streamed to clients by /jobs/<id>/events; an event's id is its position + 1
+        self.events = []
+        self.stage = None  # Last pipeline stage completed
+        self.progress = 0.0
+        self._events_changed = threading.Condition()
+        # Called with no arguments after every event, for waiters that cannot block a thread (see asgi.py)
+        self._listeners = []
+
+    def add_event(self, event, **data):
+        with self._events_changed:
+            self.events.append({'id': len(self.events) + 1, 'event': event, 'status': self.status, **data})
+            self._events_changed.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, listener):
+        with self._events_changed:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._events_changed:
+            self._listeners.remove(listener)
+
+    def stage_completed(self, stage):
+        """Progress callback for RunAll.generate_presentation."""
+        self.stage = stage
+        self.progress = min(1.0, self.progress + 1 / len(RunAll.PIPELINE_STAGES))
+        self.add_event('stage', stage=stage, progress=round(self.progress, 3))
+
+    def wait_for_events(self, after, timeout):
+        """Events after the first `after` ones, waiting up to timeout seconds for one to arrive."""
+        with self._events_changed:
+            self._events_changed.wait_for(lambda: len(self.events) > after, timeout)
+            return self.events[after:]
+
+    def events_after(self, after):
+        """Events after the first `after` ones, without waiting."""
+        with self._events_changed:
+            return self.events[after:]
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'filename': self.filename,
+            'error': self.error,
+            'cached': self.cached,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'timings': self.timings,
+        }
+
+
+class Batch:
+    """Several workbooks uploaded together; each readable one becomes its own job."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.items = []
+        self.created_at = time.time()
+
+    def add(self, filename, job=None, error=None):
+        self.items.append({'filename': filename, 'job': job, 'error': error})
+
+    @property
+    def finished(self):
+        return all(item['job'] is None or item['job'].status in (JOB_DONE, JOB_FAILED) for item in self.items)
+
+    def to_dict(self):
+        files = []
+        for item in self.items:
+            job = item['job']
+            files.append({
+                'filename': item['filename'],
+                'job_id': job.id if job else None,
+                # Files that could not be read never became a job
+                'status': job.status if job else JOB_FAILED,
+                'error': job.error if job else item['error'],
+            })
+        return {
+            'batch_id': self.id,
+            'finished': self.finished,
+            'done': sum(f['status'] == JOB_DONE for f in files),
+            'failed': sum(f['status'] == JOB_FAILED for f in files),
+            'files': files,
+        }
+
+
+class _SlideSnapshot:
+    """Stand-in for the SlideCache in a job process: the cached slides of one table, and the slides built."""
+
+    def __init__(self, slides):
+        self.slides = slides
+        self.built = {}
+
+    def get(self, key):
+        return self.slides.get(key)
+
+    def put(self, key, xmls):
+        self.built[key] = xmls
+
+
+def _start_job_process():
+    """Initializer of the job processes: load the models before the first job."""
+    try:
+        nlp_models.prewarm()
+    except Exception as e:
+        # The process stays usable; its jobs load the models again and fail with the error
+        logger.error(f"Could not load the models in job process {os.getpid()}: {str(e)}")
+
+
+def _generate_deck(table, cached_slides, parallel, timings, progress):
+    """Body of a job in a job process: the deck, its timings and the slides to cache.
+
+    progress is a manager queue the stages are put on as they complete, for
+    the worker thread waiting on the job to turn into progress events.
+    """
+    slides = _SlideSnapshot(cached_slides) if cached_slides is not None else None
+    deck = io.BytesIO()
+    RunAll.generate_presentation(table, deck, slides, parallel=parallel, timings=timings, progress=progress.put)
+    return deck.getvalue(), timings, slides.built if slides is not None else {}
+
+
+class JobQueue:
+    """Queue of deck generation jobs processed by a pool of long-lived worker threads.
+
+    With processes, the default for the web app, each worker thread hands its
+    job to a pool of as many job processes, so decks are generated on separate
+    cores instead of sharing one GIL with the request threads. Without, the
+    worker threads generate the decks themselves. Either way the models are
+    pre-warmed once per process that uses them, instead of once per upload.
+    With a DeckCache, a table that was already generated is answered from the
+    cache without queueing any work; with a SlideCache, an edited table only
+    rebuilds the slides that depend on the edited cells. parallel_slides builds
+    the slides of each job concurrently (see RunAll.generate_presentation).
+    Jobs slower than slow_job_seconds are logged as warnings. Finished decks
+    are put in result_store under the job id, so any process sharing the store
+    can serve them.
+    """
+
+    def __init__(self, num_workers=2, cache=None, slide_cache=None, parallel_slides=False, slow_job_seconds=None,
+                 result_store=None, processes=False):
+        self.num_workers = num_workers
+        self.processes = processes
+        self.result_store = result_store if result_store is not None else MemoryResultStore()
+        self.cache = cache
+        self.slide_cache = slide_cache
+        self.parallel_slides = parallel_slides
+        self.slow_job_seconds = slow_job_seconds
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        # Job processes and the manager carrying their progress back, created on first use
+        self._pool = None
+        self._manager = None
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        logger.info(f"Job queue started with {self.num_workers} workers")
+
+    def submit(self, table, filename, timings=None):
+        # Start the workers lazily so that nothing is spawned before gunicorn forks
+        self.start()
+        job = Job(table, filename, timings)
+        if self.cache is not None:
+            job.cache_key = cache_key(table, RunAll.output_version())
+            cached_path = self.cache.get(job.cache_key)
+            if cached_path is not None:
+                # Same table as an earlier upload, reuse its deck
+                try:
+                    with open(cached_path, 'rb') as cached_deck:
+                        self.result_store.put(job.id, cached_deck)
+                except OSError as e:
+                    # Evicted by another process since get(), generate the deck as on a miss
+                    logger.warning(f"Cached deck {job.cache_key} disappeared, generating it again: {str(e)}")
+                    cached_path = None
+            if cached_path is not None:
+                job.status = JOB_DONE
+                job.cached = True
+                job.table = None
+                job.progress = 1.0
+                job.started_at = job.finished_at = time.time()
+                job.add_event(JOB_DONE, progress=1.0, cached=True)
+                with self._lock:
+                    self._jobs[job.id] = job
+                metrics.observe_job(job.timings)
+                metrics.jobs_total.inc(status='cached')
+                logger.info(f"Job {job.id} answered from the deck cache")
+                return job
+
+        with self._lock:
+            self._jobs[job.id] = job
+        job.add_event(JOB_QUEUED, progress=0.0)
+        self._queue.put(job)
+        logger.info(f"Job {job.id} queued for {filename}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def in_flight(self):
+        """File name prefixes of queued and running jobs, whose files must not be cleaned up."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.status in (JOB_QUEUED, JOB_RUNNING)]
+        prefixes = [job.id for job in jobs]
+        prefixes.extend(os.path.splitext(os.path.basename(job.source))[0] for job in jobs if job.source)
+        return prefixes
+
+    def prune(self, max_age_seconds):
+        """Forget jobs that finished, and batches created, more than max_age_seconds ago.
+
+        Their decks are served from the result store for as long as it keeps
+        them. Returns the number of jobs forgotten.
+        """
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            for batch_id, batch in list(self._batches.items()):
+                if batch.created_at < cutoff and batch.finished:
+                    del self._batches[batch_id]
+        if expired:
+            logger.info(f"Forgot {len(expired)} finished jobs")
+        return len(expired)
+
+    def add_batch(self, batch):
+        with self._lock:
+            self._batches[batch.id] = batch
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def _store_in_cache(self, job, deck):
+        if self.cache is None:
+            return
+        if job.timings.get('failed_scripts'):
+            # Like slides in the slide cache, a deck missing a slide is not reused; a re-upload tries again
+            logger.info(f"Deck of job {job.id} not cached, failed scripts: {', '.join(job.timings['failed_scripts'])}")
+            return
+        try:
+            self.cache.put(job.cache_key, deck)
+        except OSError as e:
+            # The deck is still served from the result store, only later reuse is lost
+            logger.error(f"Could not cache the deck of job {job.id}: {str(e)}")
+
+    def _record(self, job):
+        """Publish the job's timings as metrics and as one structured log line."""
+        job.timings['queue_wait'] = job.started_at - job.created_at
+        job.timings.setdefault('stages', {})['total'] = job.finished_at - job.started_at
+        metrics.observe_job(job.timings)
+        metrics.jobs_total.inc(status=job.status)
+        logger.info(f"Job {job.id} metrics: {json.dumps({'status': job.status, **job.timings})}")
+
+        total = job.finished_at - job.created_at
+        if self.slow_job_seconds is not None and total > self.slow_job_seconds:
+            metrics.slow_jobs_total.inc()
+            logger.warning(f"Job {job.id} took {total:.1f}s, over the {self.slow_job_seconds}s slow job threshold")
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                context = multiprocessing.get_context('spawn')
+                if self._manager is None:
+                    self._manager = context.Manager()
+                # Spawn rather than fork, the web app forks from a process running threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.num_workers, mp_context=context, initializer=_start_job_process,
+                )
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Replace a pool that broke (a job process died or failed to load the models) on next use."""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _prewarm(self):
+        """Load the models, and start the slide process pool in parallel mode."""
+        if self.processes:
+            # Start the job processes now; each loads the models in its initializer
+            pool = self._get_pool()
+            try:
+                for future in [pool.submit(nlp_models.resident_memory_mb) for _ in range(self.num_workers)]:
+                    future.result()
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+                raise
+            return
+        nlp_models.prewarm()
+        if self.parallel_slides:
+            try:
+                RunAll.warm_process_pool()
+            except Exception as e:
+                # Jobs still run, the pool is retried on their first parallel build
+                logger.error(f"Could not start the slide process pool: {str(e)}")
+
+    def _generate_in_process(self, job, deck):
+        """Generate the job's deck into deck in a job process, relaying its progress as it goes."""
+        slide_cache = self.slide_cache
+        cached_slides = None
+        if slide_cache is not None:
+            # Looked up here, so the job processes share the one slide cache of the web app
+            keys = RunAll.slide_cache_keys(job.table, CellIndex(job.table))
+            cached_slides = {key: slide_cache.get(key) for key in keys}
+            cached_slides = {key: xmls for key, xmls in cached_slides.items() if xmls is not None}
+
+        pool = self._get_pool()
+        progress = self._manager.Queue()
+        try:
+            future = pool.submit(
+                _generate_deck, job.table, cached_slides, self.parallel_slides, job.timings, progress,
+            )
+            while True:
+                # Every stage is on the queue before the job returns, so once it is done and the queue empty, all are seen
+                done = future.done()
+                try:
+                    job.stage_completed(progress.get(timeout=0.1))
+                    continue
+                except queue.Empty:
+                    if done:
+                        break
+            data, job.timings, built = future.result()
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise RuntimeError('The job process stopped unexpectedly; the job can be uploaded again')
+
+        deck.write(data)
+        if slide_cache is not None:
+            for key, xmls in built.items():
+                slide_cache.put(key, xmls)
+
+    def _work(self):
+        # Load the models once, before the first job
+        try:
+            self._prewarm()
+            warmed = True
+        except Exception as e:
+            # Retried with the next job, which fails with this error if it happens again
+            logger.error(f"Could not load the models: {str(e)}")
+            warmed = False
+
+        while True:
+            job = self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            job.add_event(JOB_RUNNING, progress=0.0)
+            try:
+                if not warmed:
+                    self._prewarm()
+                    warmed = True
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as deck:
+                    if self.processes:
+                        self._generate_in_process(job, deck)
+                    else:
+                        RunAll.generate_presentation(
+                            job.table, deck, self.slide_cache, parallel=self.parallel_slides, timings=job.timings,
+                            progress=job.stage_completed,
+                        )
+                    deck.seek(0)
+                    self.result_store.put(job.id, deck)
+                    deck.seek(0)
+                    self._store_in_cache(job, deck)
+                job.status = JOB_DONE
+                job.progress = 1.0
+                job.add_event(JOB_DONE, progress=1.0, cached=False)
+                logger.info(f"Job {job.id} finished: {job.filename}")
+            except Exception as e:
+                job.error = str(e)
+                job.status = JOB_FAILED
+                job.add_event(JOB_FAILED, error=job.error)
+                logger.error(f"Job {job.id} failed: {str(e)}")
+            finally:
+                job.finished_at = time.time()
+                # The table is no longer needed once the deck is saved
+                job.table = None
+                self._record(job)
+                self._queue.task_done()
@@ -0,0 +1,109 @@
+import math
+
+from pptx.util import Inches, Pt
+
+from renderer import SlideRenderer
+
+# Average width of a character and height of a line, as a fraction of the font size
+CHAR_WIDTH_EM = 0.55
+LINE_HEIGHT_EM = 1.2
+# Only about 70% (1/sqrt(2)) of an ellipse's bounding box is usable for text
+ELLIPSE_TEXT_RATIO = 1 / math.sqrt(2)
+# Space between the text and the edge of its shape, on each side
+TEXT_PADDING = Inches(0.1)
+
+
+def measure_text(text, font_size):
+    """Estimated (width, height) of text set on one line per line break, in EMU."""
+    lines = text.split('\n')
+    longest = max(len(line) for line in lines)
+    return int(longest * font_size * CHAR_WIDTH_EM), int(len(lines) * font_size * LINE_HEIGHT_EM)
+
+
+def node_size(text, font_size, min_width, min_height, max_width, ellipse=True):
+    """Size of a node that fits its text, wrapping the text onto more lines past max_width.
+
+    Nodes never get smaller than min_width x min_height, so short texts keep
+    the builders' usual node size.
+    """
+    ratio = ELLIPSE_TEXT_RATIO if ellipse else 1
+    text_width, text_height = measure_text(text, Pt(font_size))
+    width = text_width / ratio + 2 * TEXT_PADDING
+    if width > max_width:
+        # Wrapped text needs about as many lines as it is too wide
+        text_height *= math.ceil(width / max_width)
+        width = max_width
+    height = text_height / ratio + 2 * TEXT_PADDING
+    return max(int(width), int(min_width)), max(int(height), int(min_height))
+
+
+class GridLayout:
+    """Places nodes one after another in rows, wrapping to a new row and then a new slide.
+
+    Each place() call only looks at the running cursor, so laying out N nodes
+    is O(N). Rows are as tall as their tallest node. With columns=True nodes
+    run top to bottom instead and wrap to a new column, which is as wide as
+    its widest node.
+    """
+
+    def __init__(self, slide_width, slide_height, left_margin, top_margin, gap_x=0, gap_y=0, columns=False,
+                 right_margin=Inches(0.5), bottom_margin=Inches(0.5)):
+        self.left_margin = left_margin
+        self.top_margin = top_margin
+        self.right = slide_width - right_margin
+        self.bottom = slide_height - bottom_margin
+        self.gap_x = gap_x
+        self.gap_y = gap_y
+        self.columns = columns
+        self.page = 0
+        self._x = left_margin
+        self._y = top_margin
+        self._line = 0  # Height of the current row, or width of the current column
+
+    def place(self, width, height):
+        """Return (page, left, top) for the next node of the given size."""
+        if self.columns:
+            if self._y + height > self.bottom and self._y > self.top_margin:
+                # Next column
+                self._x += self._line + self.gap_x
+                self._y = self.top_margin
+                self._line = 0
+            if self._x + width > self.right and self._x > self.left_margin:
+                self._new_page()
+            position = (self.page, self._x, self._y)
+            self._y += height + self.gap_y
+            self._line = max(self._line, width)
+        else:
+            if self._x + width > self.right and self._x > self.left_margin:
+                # Next row
+                self._y += self._line + self.gap_y
+                self._x = self.left_margin
+                self._line = 0
+            if self._y + height > self.bottom and self._y > self.top_margin:
+                self._new_page()
+            position = (self.page, self._x, self._y)
+            self._x += width + self.gap_x
+            self._line = max(self._line, height)
+        return position
+
+    def _new_page(self):
+        self.page += 1
+        self._x = self.left_margin
+        self._y = self.top_margin
+        self._line = 0
+
+
+class PagedSlides:
+    """A builder's slide plus the continuation slides added when its nodes overflow."""
+
+    def __init__(self, presentation, slide_layout):
+        self.presentation = presentation
+        self.slide_layout = slide_layout
+        self.renderers = []
+
+    def renderer(self, page):
+        """SlideRenderer of the given page, adding slides up to it if needed."""
+        while len(self.renderers) <= page:
+            slide = self.presentation.slides.add_slide(self.slide_layout)
+            self.renderers.append(SlideRenderer(slide))
+        return self.renderers[page]
@@ -1,9 +1,23 @@
-from flask import Flask, render_template, request, send_file, jsonify, session
-import subprocess
+from flask import Flask, Response, render_template, request, jsonify, session, url_for
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.wsgi import wrap_file
+import json
+import mimetypes
 import os
 import logging
+import time
 import uuid  # for generating unique identifiers
-import pandas as pd # for importing xlsx file
+import zipfile
+import zlib
+from archives import list_workbooks, stream_zip
+from cleanup import CleanupService
+from deck_cache import DeckCache
+from jobs import Batch, JobQueue, JOB_DONE, JOB_FAILED
+import metrics
+from result_store import create_result_store
+from phrase_cache import get_phrase_cache
+from slide_cache import SlideCache
+from sipoc import SipocTable, SipocTableError
 
 app = Flask(__name__)
 # Tell Flask how to handle cookies better
@@ -11,6 +25,43 @@ app.config['SESSION_COOKIE_SECURE'] = True  # Set to True if you use HTTPS other
 app.config['SESSION_COOKIE_SAMESITE'] = "None"  # or "None" if cross-site requests
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Prevent JS access
 app.secret_key = 'dskjfh83hf928hf98h3fh9823h9hf9'  # some long random string
+# Number of background workers generating decks (override with PROH_JOB_WORKERS)
+app.config['JOB_WORKERS'] = int(os.environ.get('PROH_JOB_WORKERS', 2))
+# Generate decks in that many job processes, one core each; PROH_JOB_PROCESSES=0 generates them in threads
+app.config['JOB_PROCESSES'] = os.environ.get('PROH_JOB_PROCESSES', '1') == '1'
+# Generated decks are reused for identical tables until they expire or the cache is full
+app.config['DECK_CACHE_DIR'] = os.environ.get('PROH_DECK_CACHE_DIR', os.path.join('uploads', 'cache'))
+app.config['DECK_CACHE_MAX_MB'] = int(os.environ.get('PROH_DECK_CACHE_MAX_MB', 500))
+app.config['DECK_CACHE_MAX_AGE_HOURS'] = float(os.environ.get('PROH_DECK_CACHE_MAX_AGE_HOURS', 72))
+# Built slides kept in memory so edited tables only rebuild the slides that changed
+app.config['SLIDE_CACHE_ENTRIES'] = int(os.environ.get('PROH_SLIDE_CACHE_ENTRIES', 500))
+# Build the slides of a job concurrently, with scripts 1 and 5 in a process pool
+app.config['PARALLEL_SLIDES'] = os.environ.get('PROH_PARALLEL_SLIDES') == '1'
+# Most workbooks accepted by one /batch request, and how large they may be once unpacked from zips
+app.config['MAX_BATCH_FILES'] = int(os.environ.get('PROH_MAX_BATCH_FILES', 100))
+app.config['MAX_BATCH_UNPACKED_MB'] = int(os.environ.get('PROH_MAX_BATCH_UNPACKED_MB', 256))
+# Jobs taking longer than this from upload to deck are logged and counted as slow
+app.config['SLOW_JOB_SECONDS'] = float(os.environ.get('PROH_SLOW_JOB_SECONDS', 30))
+# Progress streams end after this long; browsers reconnect and resume from the last event they saw.
+# Served by asgi.py, an open stream costs no thread. Served by this WSGI app, every open stream
+# holds a request thread, so it ends after the first events it delivers or EVENTS_POLL_SECONDS,
+# whichever comes first; size GUNICORN_THREADS for the progress watchers as well (gunicorn.conf.py).
+app.config['EVENTS_STREAM_SECONDS'] = float(os.environ.get('PROH_EVENTS_STREAM_SECONDS', 25))
+app.config['EVENTS_POLL_SECONDS'] = float(os.environ.get('PROH_EVENTS_POLL_SECONDS', 5))
+# Where finished decks are kept: 'directory' (shared between nodes through RESULT_DIR) or 'memory' for testing
+app.config['RESULT_STORE'] = os.environ.get('PROH_RESULT_STORE', 'directory')
+app.config['RESULT_DIR'] = os.environ.get('PROH_RESULT_DIR', os.path.join('uploads', 'results'))
+# Finished decks and upload leftovers are removed after RETENTION_HOURS, or least recently used first past RETENTION_MAX_MB;
+# the in-process cleanup also forgets jobs that finished more than RETENTION_HOURS ago
+app.config['RETENTION_HOURS'] = float(os.environ.get('PROH_RETENTION_HOURS', 24))
+app.config['RETENTION_MAX_MB'] = int(os.environ.get('PROH_RETENTION_MAX_MB', 1000))
+# How often the in-process cleanup runs, 0 to leave it to `python3 cleanup.py` (e.g. from cron)
+app.config['CLEANUP_INTERVAL_MINUTES'] = float(os.environ.get('PROH_CLEANUP_INTERVAL_MINUTES', 10))
+# Uploads are rejected before any parsing past this size (the whole request, so a /batch zip counts once)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('PROH_MAX_UPLOAD_MB', 32)) * 1024 * 1024
+# Tables are rejected at the first row past these limits, before any deck is queued
+app.config['MAX_TABLE_ROWS'] = int(os.environ.get('PROH_MAX_TABLE_ROWS', 2000))
+app.config['MAX_CELL_CHARS'] = int(os.environ.get('PROH_MAX_CELL_CHARS', 1000))
 
 # Configure logging
 logging.basicConfig(filename='app.log', level=logging.INFO)
@@ -20,6 +71,107 @@ UPLOAD_SUCCESS = "File uploaded and processed successfully"
 NO_FILE_SELECTED = "No file selected"
 
 
+def table_checks():
+    """Validation options of SipocTable.from_xlsx for uploaded workbooks."""
+    return {
+        'validate_header': True,
+        'max_rows': app.config['MAX_TABLE_ROWS'],
+        'max_cell_chars': app.config['MAX_CELL_CHARS'],
+    }
+
+
+def reject_upload(code, message, status=400, **details):
+    """Structured error response of the upload routes, counted by reason."""
+    metrics.upload_rejections_total.inc(reason=code)
+    return jsonify({'error': message, 'code': code, **details}), status
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    max_bytes = app.config['MAX_CONTENT_LENGTH']
+    return reject_upload('too_large', f"The upload is larger than {max_bytes // (1024 * 1024)} MB", 413,
+                         max_bytes=max_bytes)
+
+# Cache of generated decks, shared by every process using the same directory
+deck_cache = DeckCache(
+    app.config['DECK_CACHE_DIR'],
+    max_bytes=app.config['DECK_CACHE_MAX_MB'] * 1024 * 1024,
+    max_age_seconds=app.config['DECK_CACHE_MAX_AGE_HOURS'] * 3600,
+)
+
+# Finished decks, keyed by job id so any node using the same store can serve them
+result_store = create_result_store(app.config['RESULT_STORE'], app.config['RESULT_DIR'])
+
+# Cache of built slides, one per process
+slide_cache = SlideCache(max_entries=app.config['SLIDE_CACHE_ENTRIES'])
+
+# Background job queue, one per process
+job_queue = JobQueue(
+    num_workers=app.config['JOB_WORKERS'],
+    cache=deck_cache,
+    slide_cache=slide_cache,
+    parallel_slides=app.config['PARALLEL_SLIDES'],
+    slow_job_seconds=app.config['SLOW_JOB_SECONDS'],
+    result_store=result_store,
+    processes=app.config['JOB_PROCESSES'],
+)
+
+# Cache and queue figures are read from their own counters when /metrics is scraped
+# Retention of finished decks and upload leftovers, never touching files of queued or running jobs
+cleanup_service = CleanupService(
+    'uploads',
+    app.config['RESULT_DIR'],
+    max_age_seconds=app.config['RETENTION_HOURS'] * 3600,
+    max_bytes=app.config['RETENTION_MAX_MB'] * 1024 * 1024,
+    interval_seconds=app.config['CLEANUP_INTERVAL_MINUTES'] * 60,
+    in_flight=job_queue.in_flight,
+    prune_jobs=job_queue.prune,
+)
+
+metrics.Callback('proh_job_queue_depth', 'Jobs waiting for a worker.', 'gauge', job_queue.queue_depth)
+metrics.Callback('proh_deck_cache_hits_total', 'Uploads answered from the deck cache.', 'counter',
+                 lambda: deck_cache.stats()['hits'])
+metrics.Callback('proh_deck_cache_misses_total', 'Uploads not found in the deck cache.', 'counter',
+                 lambda: deck_cache.stats()['misses'])
+metrics.Callback('proh_deck_cache_evictions_total', 'Decks evicted from the deck cache.', 'counter',
+                 lambda: deck_cache.stats()['evictions'])
+metrics.Callback('proh_slide_cache_hits_total', 'Slides reused from the slide cache.', 'counter',
+                 lambda: slide_cache.stats()['hits'])
+metrics.Callback('proh_slide_cache_misses_total', 'Slides that had to be built.', 'counter',
+                 lambda: slide_cache.stats()['misses'])
+
+# Verb tagger results shared by every process on the host (PROH_PHRASE_CACHE, PROH_PHRASE_CACHE_ENTRIES)
+phrase_cache = get_phrase_cache()
+if phrase_cache is not None:
+    metrics.Callback('proh_phrase_cache_hits_total', 'Cells whose verbs were found in the phrase cache.', 'counter',
+                     lambda: phrase_cache.stats()['hits'])
+    metrics.Callback('proh_phrase_cache_misses_total', 'Cells that had to be tagged.', 'counter',
+                     lambda: phrase_cache.stats()['misses'])
+    metrics.Callback('proh_phrase_cache_hit_ratio', 'Share of cell lookups answered by the phrase cache.', 'gauge',
+                     lambda: phrase_cache.stats()['hit_rate'])
+    metrics.Callback('proh_phrase_cache_evictions_total', 'Phrases evicted from the phrase cache.', 'counter',
+                     lambda: phrase_cache.stats()['evictions'])
+    metrics.Callback('proh_phrase_cache_entries', 'Phrases in the phrase cache.', 'gauge', phrase_cache.entries)
+
+
+def send_result(result, download_name):
+    """Stream a stored deck, answering Range, If-None-Match and If-Modified-Since requests."""
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = Response(wrap_file(request.environ, result.open()), mimetype=mimetype, direct_passthrough=True)
+    response.content_length = result.size
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.set_etag(result.etag)
+    response.last_modified = result.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request.environ, accept_ranges=True, complete_length=result.size)
+
+
+@app.before_request
+def start_cleanup():
+    # Started lazily, like the job workers, so that no thread exists before gunicorn forks
+    cleanup_service.start()
+
+
 @app.route("/")
 def index():
     return render_template('index.html', upload_status="")
@@ -30,13 +182,13 @@ def index():
 def upload():
     try:
         if 'file' not in request.files:
-            return jsonify({'No file selected'}), 400
+            return reject_upload('no_file', NO_FILE_SELECTED)
 
         file = request.files['file']
         if file.filename == '':
-            return jsonify({'No file selected'}), 400
-        if not file.filename.endswith('.xlsx') and not file.filename.endswith('.xls'):
-            return jsonify({'File must be in Excel format (.xlsx or .xls)'}), 400
+            return reject_upload('no_file', NO_FILE_SELECTED)
+        if not file.filename.endswith('.xlsx'):
+            return reject_upload('wrong_format', 'File must be in Excel format (.xlsx)')
 
         # Generate a unique identifier
         unique_identifier = str(uuid.uuid4())[:8]  # Adjust the length of the unique code as needed
@@ -47,64 +199,252 @@ def upload():
         # Append the unique identifier to the filename
         filename_with_identifier = f"{filename}_{unique_identifier}{extension}"
 
-        # Save the file with the new filename
+        # Read the workbook straight from the upload stream, without saving it
         file_path = os.path.join('uploads', filename_with_identifier)
-        file.save(file_path)
-        logging.info("Excel file saved successfully.")
-
-        # Convert Excel to CSV
-        excel_df = pd.read_excel(file_path)
-        csv_filename = f"{filename}_{unique_identifier}.csv"
-        csv_file_path = os.path.join('uploads', csv_filename)
-        excel_df.to_csv(csv_file_path, index=False)
-        logging.info("CSV file saved successfully.")
+        start = time.perf_counter()
+        table = SipocTable.from_xlsx(file.stream, source=file_path, **table_checks())
+        timings = {'stages': {'ingest': time.perf_counter() - start}}
+        logging.info("Excel file read successfully.")
 
         # Store the file path in session
-        session['file_path'] = csv_file_path
-        logging.info(f"Uploaded filepath: {csv_file_path}")
+        session['file_path'] = file_path
+        logging.info(f"Uploaded filepath: {file_path}")
         
 
         # Construct the filename without the extension
         filename_without_extension = os.path.splitext(filename_with_identifier)[0]
         logging.info(f"Filename without extension: {filename_without_extension}")
 
-        # Call the script with the uploaded file as an argument
-        subprocess.run(['python3', 'RunAll.py', csv_file_path])
-        logging.info("RunAll.py is being executed.")
+        # Queue the deck generation and return straight away
+        combined_file = f"{filename_without_extension}_combined.pptx"
+        job = job_queue.submit(table, combined_file, timings)
+        session['job_id'] = job.id
+        logging.info(f"Job {job.id} queued for generation.")
 
-        return jsonify({'message': 'Upload successful'}), 200
+        return jsonify({
+            'message': 'Upload successful',
+            'job_id': job.id,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id),
+        }), 202
+    except SipocTableError as e:
+        logging.error(f'Invalid SIPOC table: {str(e)}')
+        metrics.upload_rejections_total.inc(reason=e.code)
+        return jsonify(e.to_dict()), 400
+    except HTTPException:
+        # Answered by Flask or the error handlers above, e.g. 413 for oversized uploads
+        raise
     except Exception as e:
         # Log any exceptions that occur
         logging.error(f'An error occurred: {str(e)}')
         return jsonify({'error': 'An error occurred while processing the file'}), 500
         
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        # Queued on another node, which has already put the deck in the shared store
+        if result_store.get(job_id) is not None:
+            return jsonify({
+                'job_id': job_id,
+                'status': JOB_DONE,
+                'result_url': url_for('job_result', job_id=job_id),
+            }), 200
+        return jsonify({'error': 'Job not found.'}), 404
+
+    response = job.to_dict()
+    if job.status == JOB_DONE:
+        response['result_url'] = url_for('job_result', job_id=job.id)
+    return jsonify(response), 200
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events: one per pipeline stage as it completes, then done (with result_url) or failed."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+
+    after = last_event_id(request.headers.get('Last-Event-ID'), request.args.get('after'))
+    result_url = url_for('job_result', job_id=job.id)
+    poll_seconds = app.config['EVENTS_POLL_SECONDS']
+
+    def stream():
+        # Reconnect straight away, the stream ends after every batch of events
+        yield EVENTS_RETRY
+        # Each call waits at most poll_seconds, so a watcher gives its thread back at least that often
+        events = job.wait_for_events(after, timeout=poll_seconds)
+        if not events:
+            # Comment line, keeps proxies from timing the connection out
+            yield ': keep-alive\n\n'
+        for event in events:
+            yield event_message(event, result_url)
+
+    return Response(stream(), mimetype='text/event-stream', headers=EVENTS_HEADERS)
+
+
+# Start of every progress stream: browsers reconnect a quarter of a second after one ends
+EVENTS_RETRY = 'retry: 250\n\n'
+EVENTS_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def last_event_id(header, argument):
+    """Id of the last event a client saw; browsers send it in Last-Event-ID when they reconnect."""
+    try:
+        return int(header or argument or 0)
+    except ValueError:
+        return 0
+
+
+def event_message(event, result_url):
+    """Server-sent event for one job event; done events carry the URL of the deck."""
+    data = dict(event)
+    if event['event'] == JOB_DONE:
+        data['result_url'] = result_url
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is not None and job.status == JOB_FAILED:
+        return jsonify({'error': 'Job failed.', 'status': job.status}), 500
+    if job is not None and job.status != JOB_DONE:
+        return jsonify({'error': 'Job is not finished yet.', 'status': job.status}), 409
+
+    # Jobs from other nodes are unknown here, but their decks are in the shared store
+    result = result_store.get(job_id)
+    if result is None:
+        if job is None:
+            return jsonify({'error': 'Job not found.'}), 404
+        logging.error(f"Result of job {job.id} not found in the result store.")
+        return jsonify({'error': 'Combined file not found.'}), 404
+    download_name = job.filename if job is not None else f"{job_id[:8]}_combined.pptx"
+    return send_result(result, download_name)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus text exposition format
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    try:
+        # Accept a zip of workbooks and/or several workbooks in one request
+        uploads = request.files.getlist('files') + request.files.getlist('file')
+        uploads = [upload for upload in uploads if upload.filename]
+        if not uploads:
+            return reject_upload('no_file', NO_FILE_SELECTED)
+
+        # Check the zip directories before unpacking anything
+        workbooks = list_workbooks(uploads, max_member_bytes=app.config['MAX_CONTENT_LENGTH'])
+        if len(workbooks) > app.config['MAX_BATCH_FILES']:
+            return reject_upload('too_many_files', f"A batch can contain at most {app.config['MAX_BATCH_FILES']} workbooks")
+        max_unpacked_bytes = app.config['MAX_BATCH_UNPACKED_MB'] * 1024 * 1024
+        if sum(workbook.unpacked_bytes for workbook in workbooks) > max_unpacked_bytes:
+            return reject_upload('too_large', f"The workbooks of a batch can unpack to at most "
+                                 f"{app.config['MAX_BATCH_UNPACKED_MB']} MB", 413, max_bytes=max_unpacked_bytes)
+
+        batch = Batch()
+        for index, (filename, _, open_workbook, error) in enumerate(workbooks):
+            if open_workbook is None:
+                batch.add(filename, error=error)
+                continue
+            name = os.path.splitext(os.path.basename(filename))[0]
+            file_path = os.path.join('uploads', f"{name}_{batch.id[:8]}_{index}.xlsx")
+            try:
+                # Only one unpacked workbook is held at a time
+                table = SipocTable.from_xlsx(open_workbook(), source=file_path, **table_checks())
+            except SipocTableError as e:
+                metrics.upload_rejections_total.inc(reason=e.code)
+                batch.add(filename, error=str(e))
+                continue
+            except (zipfile.BadZipFile, zlib.error):
+                # Member damaged although the zip directory was readable
+                batch.add(filename, error='File is not a valid zip archive')
+                continue
+            # The job workers bound how many decks are generated at once
+            combined_file = f"{name}_{batch.id[:8]}_{index}_combined.pptx"
+            batch.add(filename, job=job_queue.submit(table, combined_file))
+        job_queue.add_batch(batch)
+        logging.info(f"Batch {batch.id} queued with {len(batch.items)} files.")
+
+        response = batch.to_dict()
+        response['status_url'] = url_for('batch_status', batch_id=batch.id)
+        response['result_url'] = url_for('batch_result', batch_id=batch.id)
+        return jsonify(response), 202
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f'An error occurred while queueing a batch: {str(e)}')
+        return jsonify({'error': 'An error occurred while processing the files'}), 500
+
+
+@app.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    batch = job_queue.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found.'}), 404
+    return jsonify(batch.to_dict()), 200
+
+
+@app.route('/batch/<batch_id>/result')
+def batch_result(batch_id):
+    batch = job_queue.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found.'}), 404
+    if not batch.finished:
+        return jsonify({'error': 'Batch is not finished yet.', **batch.to_dict()}), 409
+
+    status = batch.to_dict()
+    entries = []
+    used_names = set()
+    for item, file_status in zip(batch.items, status['files']):
+        job = item['job']
+        result = result_store.get(job.id) if job is not None and job.status == JOB_DONE else None
+        if result is None:
+            continue
+        name = os.path.splitext(os.path.basename(item['filename']))[0]
+        archive_name = f"{name}_combined.pptx"
+        # Workbooks with the same name in different folders of the zip
+        suffix = 2
+        while archive_name in used_names:
+            archive_name = f"{name}_{suffix}_combined.pptx"
+            suffix += 1
+        used_names.add(archive_name)
+        file_status['archive_name'] = archive_name
+        # Opened one at a time while the archive is streamed
+        entries.append((archive_name, result.open))
+    # Per-file status goes in the archive next to the decks
+    entries.insert(0, ('status.json', json.dumps(status, indent=2).encode('utf-8')))
+
+    return Response(
+        stream_zip(entries),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=batch_{batch.id[:8]}.zip'},
+    )
+
         
 @app.route('/download_all_files')
 def download_all_files():
     try:
-        # Get the file path from session
-        file_path = session.get('file_path')
-        
-        if file_path is None:
-            logging.error("File path is not found in session.")
+        # Get the job of the last upload from session
+        job_id = session.get('job_id')
+
+        if job_id is None:
+            logging.error("Job id is not found in session.")
             # Log session contents for debugging
             logging.info(f"Session contents: {session}")
             return jsonify({'error': 'File path not found in session.'}), 404
 
-        logging.info(f"file path from session: {file_path}")
-
-        # Specify the path to the PowerPoint file
-        filename_with_identifier = os.path.basename(file_path)
-        filename_without_extension = os.path.splitext(filename_with_identifier)[0]
-        combined_file = os.path.join('uploads', f"{filename_without_extension}_combined.pptx")
+        logging.info(f"job id from session: {job_id}, file path: {session.get('file_path')}")
 
-        if os.path.exists(combined_file):
-            # Return the file as an attachment
-            logging.info("Combined file found and will be downloaded.")
-            return send_file(combined_file, as_attachment=True)
-        else:
-            logging.error("Combined file not found.")
-            return jsonify({'error': 'Combined file not found.'}), 404
+        # Served from the result store like /jobs/<job_id>/result
+        return job_result(job_id)
 
     except Exception as e:
         # Handle exceptions
@@ -112,5 +452,6 @@ def download_all_files():
         return jsonify({'error': 'An error occurred while downloading all files.'}), 500
 
 if __name__ == "__main__":
-    app.run(debug=True, use_reloader=False, threaded=False)
+    # Threaded, so status polls are answered while an upload is being parsed
+    app.run(debug=True, use_reloader=False, threaded=True)
 
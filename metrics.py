@@ -0,0 +1,136 @@
+import bisect
+import threading
+
+# Bucket upper bounds for each kind of histogram
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SHAPES_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with _lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = _labels(self.labelnames, key, ('le', _number(bound)))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Callback:
+    """Metric whose value is read when /metrics is scraped, e.g. from a cache's own counters."""
+
+    def __init__(self, name, documentation, metric_type, function):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.function = function
+        _registry.append(self)
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_number(self.function())}",
+        ]
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics of the deck generation pipeline
+jobs_total = Counter('proh_jobs_total', 'Deck generation jobs by final status.', ['status'])
+queue_wait_seconds = Histogram('proh_job_queue_wait_seconds', 'Time jobs spent queued before a worker took them.')
+stage_seconds = Histogram('proh_stage_seconds', 'Time spent in each pipeline stage.', ['stage'])
+slide_shapes = Histogram('proh_slide_shapes', 'Shapes drawn on each generated slide.', ['script'], SHAPES_BUCKETS)
+deck_bytes = Histogram('proh_deck_bytes', 'Size of the generated decks.', buckets=BYTES_BUCKETS)
+script_errors_total = Counter('proh_script_errors_total', 'Slide scripts that failed and were skipped.', ['script'])
+slow_jobs_total = Counter('proh_slow_jobs_total', 'Jobs slower than the configured slow job threshold.')
+cleanup_removed_files_total = Counter('proh_cleanup_removed_files_total', 'Generated files removed by the uploads cleanup.',
+                                      ['reason'])
+cleanup_reclaimed_bytes_total = Counter('proh_cleanup_reclaimed_bytes_total', 'Disk space freed by the uploads cleanup.',
+                                        ['reason'])
+upload_rejections_total = Counter('proh_upload_rejections_total', 'Uploads and batch workbooks rejected before generation.',
+                                  ['reason'])
+
+
+def observe_job(timings):
+    """Record the timings collected for one job by the upload route and generate_presentation."""
+    for stage, seconds in timings.get('stages', {}).items():
+        stage_seconds.observe(seconds, stage=stage)
+    for script, shapes in timings.get('shapes', {}).items():
+        slide_shapes.observe(shapes, script=script)
+    for script in timings.get('failed_scripts', []):
+        script_errors_total.inc(script=script)
+    if 'queue_wait' in timings:
+        queue_wait_seconds.observe(timings['queue_wait'])
+    if 'output_bytes' in timings:
+        deck_bytes.observe(timings['output_bytes'])
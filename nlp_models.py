@@ -0,0 +1,128 @@
+import functools
+import importlib.metadata
+import logging
+import os
+import resource
+import threading
+import time
+
+# Create a logger instance (shared with RunAll.py)
+logger = logging.getLogger('merged_logger')
+
+# Name of the spaCy model used for verb extraction
+SPACY_MODEL_NAME = "en_core_web_sm"
+# Components we never use; only the tagger is needed to find verbs
+SPACY_EXCLUDED_COMPONENTS = ["parser", "ner", "lemmatizer"]
+
+# Verb tagger backend: 'spacy' (the model above) or 'lexicon' (verb_lexicon.py, no model to load)
+VERB_TAGGER = os.environ.get('PROH_VERB_TAGGER', 'spacy')
+
+# Models loaded so far in this process
+_spacy_model = None
+_verb_tagger = None
+_lock = threading.Lock()
+
+
+def get_spacy_model():
+    """Return the spaCy English model, loading it the first time it is needed."""
+    global _spacy_model
+    if _spacy_model is None:
+        with _lock:
+            if _spacy_model is None:
+                import spacy
+                start = time.perf_counter()
+                _spacy_model = spacy.load(SPACY_MODEL_NAME, exclude=SPACY_EXCLUDED_COMPONENTS)
+                logger.info(f"spaCy model {SPACY_MODEL_NAME} loaded in {time.perf_counter() - start:.2f}s")
+    return _spacy_model
+
+
+@functools.lru_cache(maxsize=None)
+def spacy_model_version():
+    """Version of the installed spaCy model, from its package metadata so that the model need not be loaded."""
+    try:
+        return importlib.metadata.version(SPACY_MODEL_NAME)
+    except importlib.metadata.PackageNotFoundError:
+        # Not installed as a package, ask the loaded model
+        return get_spacy_model().meta['version']
+
+
+class SpacyTagger:
+    """Tagger backend using the spaCy model's part-of-speech tags."""
+
+    name = 'spacy'
+
+    @property
+    def version(self):
+        """Model name and version, so cached results of another model, or an older release of it, are not reused."""
+        return f"{SPACY_MODEL_NAME}-{spacy_model_version()}"
+
+    def analyse(self, cells, batch_size=256):
+        """Yield (tokens, verbs, has_verb) for every cell."""
+        nlp = get_spacy_model()
+        for doc in nlp.pipe(cells, batch_size=batch_size):
+            yield (
+                [token.text for token in doc],
+                [token.text for token in doc if token.pos_ == 'VERB'],
+                any(token.tag_.startswith('VB') for token in doc),
+            )
+
+
+def create_verb_tagger(name):
+    """Create a verb tagger backend by name.
+
+    Every backend has an analyse(cells, batch_size) method yielding, per cell,
+    its tokens, the tokens that are verbs (spaCy's pos_ == 'VERB') and whether
+    any token has a VB* tag.
+    """
+    if name == 'spacy':
+        return SpacyTagger()
+    if name == 'lexicon':
+        # Imported here so the spaCy backend never loads the lexicon and vice versa
+        from verb_lexicon import LexiconTagger
+        return LexiconTagger()
+    raise ValueError(f"Unknown verb tagger: {name}")
+
+
+def get_verb_tagger():
+    """Return the verb tagger selected with PROH_VERB_TAGGER."""
+    global _verb_tagger
+    if _verb_tagger is None:
+        _verb_tagger = create_verb_tagger(VERB_TAGGER)
+    return _verb_tagger
+
+
+def resident_memory_mb():
+    """Current resident memory of this process in MB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not on Linux, fall back to the peak resident size (KB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def prewarm():
+    """Load the verb tagger now and report how long it took and how much memory it used.
+
+    Called from the job workers before their first job and from gunicorn's
+    post_fork/on_starting hooks (see gunicorn.conf.py).
+    """
+    memory_before = resident_memory_mb()
+    start = time.perf_counter()
+    tagger = get_verb_tagger()
+    if tagger.name == 'spacy':
+        get_spacy_model()
+    elapsed = time.perf_counter() - start
+    memory_after = resident_memory_mb()
+    logger.info(
+        f"Verb tagger {tagger.name} pre-warmed in pid {os.getpid()}: {elapsed:.2f}s, "
+        f"resident memory {memory_before:.0f}MB -> {memory_after:.0f}MB"
+    )
+    return {
+        'pid': os.getpid(),
+        'verb_tagger': tagger.name,
+        'load_seconds': elapsed,
+        'rss_before_mb': memory_before,
+        'rss_after_mb': memory_after,
+    }
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Create a logger instance (shared with RunAll.py)
+logger = logging.getLogger('merged_logger')
+
+# SQLite file shared by every process on the host, empty to disable the cache
+PHRASE_CACHE_PATH = os.environ.get('PROH_PHRASE_CACHE', os.path.join('uploads', 'cache', 'phrases.sqlite3'))
+# Phrases kept before the least recently used ones are evicted
+PHRASE_CACHE_ENTRIES = int(os.environ.get('PROH_PHRASE_CACHE_ENTRIES', 100000))
+
+# SQLite allows at most 999 parameters per statement in older versions
+_CHUNK = 500
+
+_phrase_cache = None
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Cache key of a cell: surrounding and repeated whitespace does not change its analysis."""
+    return ' '.join(text.split())
+
+
+class PhraseCache:
+    """Verb tagger results per phrase in an SQLite file, so repeated cells are only tagged once.
+
+    Every process opening the same file shares the entries, and every thread
+    gets its own connection. Entries are keyed on the tagger as well, and the
+    least recently used ones are evicted past max_entries. The cache only
+    speeds things up: if the database cannot be used, get_many() finds
+    nothing and put_many() stores nothing.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            # Readers do not block the writer, and commits skip the fsync a crash-safe cache does not need
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS phrases ('
+                    'tagger TEXT, phrase TEXT, analysis TEXT, last_used REAL, PRIMARY KEY (tagger, phrase))'
+                )
+                connection.execute('CREATE INDEX IF NOT EXISTS phrases_last_used ON phrases (last_used)')
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, tagger, phrases):
+        """Cached (tokens, verbs, has_verb) of the given phrases, for those that are cached."""
+        found = {}
+        try:
+            connection = self._connection()
+            for start in range(0, len(phrases), _CHUNK):
+                chunk = phrases[start:start + _CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = connection.execute(
+                    f'SELECT phrase, analysis FROM phrases WHERE tagger = ? AND phrase IN ({placeholders})',
+                    [tagger, *chunk],
+                )
+                for phrase, analysis in rows:
+                    tokens, verbs, has_verb = json.loads(analysis)
+                    found[phrase] = (tokens, verbs, has_verb)
+            if found:
+                now = time.time()
+                with connection:
+                    connection.executemany(
+                        'UPDATE phrases SET last_used = ? WHERE tagger = ? AND phrase = ?',
+                        [(now, tagger, phrase) for phrase in found],
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Phrase cache lookup failed: {str(e)}")
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(phrases) - len(found)
+        return found
+
+    def put_many(self, tagger, analyses):
+        """Store (tokens, verbs, has_verb) per phrase, then evict down to max_entries."""
+        if not analyses:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO phrases VALUES (?, ?, ?, ?)',
+                    [(tagger, phrase, json.dumps(analysis), now) for phrase, analysis in analyses.items()],
+                )
+                (entries,) = connection.execute('SELECT COUNT(*) FROM phrases').fetchone()
+                excess = entries - self.max_entries
+                if excess > 0:
+                    connection.execute(
+                        'DELETE FROM phrases WHERE rowid IN (SELECT rowid FROM phrases ORDER BY last_used LIMIT ?)',
+                        (excess,),
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Phrase cache update failed: {str(e)}")
+            return
+
+        if excess > 0:
+            with self._lock:
+                self.evictions += excess
+            logger.info(f"Phrase cache evicted {excess} entries")
+
+    def entries(self):
+        try:
+            (entries,) = self._connection().execute('SELECT COUNT(*) FROM phrases').fetchone()
+        except sqlite3.Error:
+            return 0
+        return entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def get_phrase_cache():
+    """Return this process's PhraseCache on PROH_PHRASE_CACHE, or None if it is disabled."""
+    global _phrase_cache
+    if _phrase_cache is None and PHRASE_CACHE_PATH:
+        with _lock:
+            if _phrase_cache is None:
+                _phrase_cache = PhraseCache(PHRASE_CACHE_PATH, max_entries=PHRASE_CACHE_ENTRIES)
+    return _phrase_cache
@@ -0,0 +1,131 @@
+from copy import deepcopy
+
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+
+# Theme references python-pptx gives every autoshape
+_SHAPE_STYLE = (
+    '<p:style>'
+    '<a:lnRef idx="1"><a:schemeClr val="accent1"/></a:lnRef>'
+    '<a:fillRef idx="3"><a:schemeClr val="accent1"/></a:fillRef>'
+    '<a:effectRef idx="2"><a:schemeClr val="accent1"/></a:effectRef>'
+    '<a:fontRef idx="minor"><a:schemeClr val="lt1"/></a:fontRef>'
+    '</p:style>'
+)
+
+
+def _solid_fill(rgb):
+    return f'<a:solidFill><a:srgbClr val="{rgb}"/></a:solidFill>'
+
+
+def _paragraph_properties(align, font_size=None, font_rgb=None):
+    if font_size is None:
+        return f'<a:pPr algn="{align}"/>'
+    return f'<a:pPr algn="{align}"><a:defRPr sz="{font_size}">{_solid_fill(font_rgb)}</a:defRPr></a:pPr>'
+
+
+def _autoshape(geometry, fill_rgb, paragraphs, line_width=None, dashed=False):
+    line = ''
+    if line_width is not None:
+        dash = '<a:prstDash val="dash"/>' if dashed else ''
+        line = f'<a:ln w="{line_width}">{_solid_fill("000000")}{dash}</a:ln>'
+    return (
+        f'<p:sp {nsdecls("p", "a")}>'
+        '<p:nvSpPr><p:cNvPr id="0" name=""/><p:cNvSpPr/><p:nvPr/></p:nvSpPr>'
+        '<p:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/></a:xfrm>'
+        f'<a:prstGeom prst="{geometry}"><a:avLst/></a:prstGeom>{_solid_fill(fill_rgb)}{line}</p:spPr>'
+        f'{_SHAPE_STYLE}'
+        f'<p:txBody><a:bodyPr rtlCol="0" anchor="ctr"/><a:lstStyle/>{paragraphs}</p:txBody>'
+        '</p:sp>'
+    )
+
+
+def _textbox(paragraphs):
+    return (
+        f'<p:sp {nsdecls("p", "a")}>'
+        '<p:nvSpPr><p:cNvPr id="0" name=""/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+        '<p:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="0" cy="0"/></a:xfrm>'
+        '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+        f'<p:txBody><a:bodyPr wrap="none"><a:spAutoFit/></a:bodyPr><a:lstStyle/>{paragraphs}</p:txBody>'
+        '</p:sp>'
+    )
+
+
+class NodeStyle:
+    """One kind of node, parsed once and copied for every shape drawn with it.
+
+    The text goes into the last paragraph of the template. With
+    paragraph_per_line each line of the text becomes its own paragraph, like
+    setting TextFrame.text; otherwise lines are joined by line breaks, like
+    setting the text of a paragraph added with add_paragraph().
+    """
+
+    __slots__ = ('base_name', 'template', 'paragraph_per_line', 'font_size')
+
+    def __init__(self, base_name, xml, paragraph_per_line, font_size=18):
+        self.base_name = base_name  # Shapes are named "<base name> <id - 1>", as python-pptx names them
+        self.template = parse_xml(xml)
+        self.paragraph_per_line = paragraph_per_line
+        self.font_size = font_size  # In points, for sizing nodes to their text
+
+
+# Black, centred 18pt text used by the statement ovals
+_STATEMENT_TEXT = f'<a:p>{_paragraph_properties("ctr", 1800, "000000")}</a:p>'
+# Ovals drawn with add_paragraph() keep the empty first paragraph of a new shape
+_BLANK_PARAGRAPH = f'<a:p>{_paragraph_properties("ctr")}</a:p>'
+
+# Node types of the five slides
+ACTIVITY = NodeStyle('Oval', _autoshape('ellipse', '00FF00', _STATEMENT_TEXT), True)  # Green activity oval
+RESOURCE = NodeStyle('Oval', _autoshape('ellipse', 'FF0000', _STATEMENT_TEXT), True)  # Red resource oval
+BOUNDARY = NodeStyle('Rounded Rectangle', _autoshape('roundRect', 'FFFFFF', _STATEMENT_TEXT), True)  # Previous/next step
+SUB_BUBBLE = NodeStyle('Oval', _autoshape(
+    'ellipse', 'FFFFFF', _BLANK_PARAGRAPH + f'<a:p>{_paragraph_properties("l", 1800, "000000")}</a:p>', line_width=19050,
+), False)
+DECISION = NodeStyle('Oval', _autoshape(
+    'ellipse', 'FFFFFF', _BLANK_PARAGRAPH + f'<a:p>{_paragraph_properties("ctr", 1400, "000000")}</a:p>', line_width=12700,
+    dashed=True,
+), False, font_size=14)
+DECISION_CONDITION = NodeStyle('Oval', _autoshape(
+    'ellipse', 'FFFFFF', _BLANK_PARAGRAPH + f'<a:p>{_paragraph_properties("ctr", 1200, "000000")}</a:p>', line_width=12700,
+), False, font_size=12)
+VERB = NodeStyle('TextBox', _textbox(f'<a:p>{_paragraph_properties("ctr")}</a:p>'), True)  # Verb text box
+
+
+class SlideRenderer:
+    """Draws styled nodes on one slide by copying their precomputed XML.
+
+    This replaces add_shape()/add_textbox() followed by one python-pptx call
+    per fill, line and font property. Shape ids are counted here instead of
+    python-pptx searching the whole shape tree for the highest id on every
+    shape, which made dense slides quadratic.
+    """
+
+    def __init__(self, slide):
+        self._sp_tree = slide.shapes._spTree
+        self._next_id = self._sp_tree.max_shape_id + 1
+
+    def add(self, style, left, top, width, height, text):
+        sp = deepcopy(style.template)
+        shape_id = self._next_id
+        self._next_id += 1
+
+        c_nv_pr = sp[0][0]  # p:nvSpPr/p:cNvPr
+        c_nv_pr.set('id', str(shape_id))
+        c_nv_pr.set('name', f"{style.base_name} {shape_id - 1}")
+        offset, extent = sp[1][0]  # p:spPr/a:xfrm
+        offset.set('x', str(int(left)))
+        offset.set('y', str(int(top)))
+        extent.set('cx', str(int(width)))
+        extent.set('cy', str(int(height)))
+
+        tx_body = sp[-1]
+        if style.paragraph_per_line:
+            lines = text.split('\n')
+            tx_body[-1].append_text(lines[0])
+            for line in lines[1:]:
+                tx_body.add_p().append_text(line)
+        else:
+            tx_body[-1].append_text(text)
+
+        self._sp_tree.insert_element_before(sp, 'p:extLst')
+        return sp
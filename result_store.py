@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+
+
+class StoredResult:
+    """A generated deck held by a result store, with what is needed to serve it over HTTP."""
+
+    __slots__ = ('key', 'size', 'etag', 'last_modified', '_opener')
+
+    def __init__(self, key, size, etag, last_modified, opener):
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self._opener = opener
+
+    def open(self):
+        """Seekable binary file with the deck's contents."""
+        return self._opener()
+
+
+class DirectoryResultStore:
+    """Results kept as files in one directory, which app nodes can share over a common volume."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pptx")
+
+    def put(self, key, data):
+        """Store the contents of a binary file object under key."""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as target:
+            shutil.copyfileobj(data, target)
+        # Atomic, so other nodes never serve a half-written deck
+        os.replace(temp_path, path)
+        return self.get(key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        # Results never change once written, so name, size and time identify the content
+        etag = f"{key}-{stat.st_size}-{int(stat.st_mtime)}"
+
+        def opener():
+            # Record the download in the access time, which the uploads cleanup evicts by
+            os.utime(path, (time.time(), stat.st_mtime))
+            return open(path, 'rb')
+
+        return StoredResult(key, stat.st_size, etag, stat.st_mtime, opener)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class MemoryResultStore:
+    """Object-store stand-in for development and testing: whole objects in memory, MD5 etags."""
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, data):
+        content = data.read()
+        with self._lock:
+            self._objects[key] = (content, hashlib.md5(content).hexdigest(), time.time())
+        return self.get(key)
+
+    def get(self, key):
+        with self._lock:
+            stored = self._objects.get(key)
+        if stored is None:
+            return None
+        content, etag, last_modified = stored
+        return StoredResult(key, len(content), etag, last_modified, lambda: io.BytesIO(content))
+
+    def delete(self, key):
+        with self._lock:
+            self._objects.pop(key, None)
+
+
+def create_result_store(kind, directory):
+    if kind == 'directory':
+        return DirectoryResultStore(directory)
+    if kind == 'memory':
+        return MemoryResultStore()
+    raise ValueError(f"Unknown result store: {kind}")
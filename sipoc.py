@@ -0,0 +1,193 @@
+import csv
+import hashlib
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+# Columns A-F of the SIPOC table template
+COLUMN_NAMES = ('previous', 'input', 'resource', 'activity', 'output', 'next')
+NUM_COLUMNS = len(COLUMN_NAMES)
+COLUMN_LETTERS = 'ABCDEF'
+
+# The workbook users download and fill in; its first row holds the headings
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'SipocTableTemplate.xlsx')
+
+
+class SipocTableError(ValueError):
+    """The uploaded table does not follow the SIPOC template layout.
+
+    code names the problem for API clients (e.g. 'header_mismatch',
+    'too_many_rows'); row and column (1-based row, column letter) point at
+    the offending cell when there is one.
+    """
+
+    def __init__(self, message, code='invalid_table', row=None, column=None):
+        super().__init__(message)
+        self.code = code
+        self.row = row
+        self.column = column
+
+    def to_dict(self):
+        """JSON error body of the upload routes."""
+        error = {'error': str(self), 'code': self.code}
+        if self.row is not None:
+            error['row'] = self.row
+        if self.column is not None:
+            error['column'] = self.column
+        return error
+
+
+@lru_cache(maxsize=1)
+def template_headings():
+    """Headings of columns A-F in the template workbook, read once."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(TEMPLATE_PATH, read_only=True, data_only=True)
+    try:
+        first_row = next(workbook.active.iter_rows(max_row=1, values_only=True))
+    finally:
+        workbook.close()
+    headings = [_cell_text(cell) for cell in first_row[:NUM_COLUMNS]]
+    return tuple(headings + [''] * (NUM_COLUMNS - len(headings)))
+
+
+def _normalize_heading(text):
+    return ' '.join(text.split()).upper()
+
+
+def check_header(cells):
+    """Raise SipocTableError unless every heading starts with the template's heading of its column.
+
+    Users often add a description after the heading (e.g. "INPUT: order form"),
+    so only the start of each heading is compared, ignoring case and spacing.
+    """
+    for column, (cell, heading) in enumerate(zip(cells, template_headings())):
+        if not _normalize_heading(cell).startswith(_normalize_heading(heading)):
+            raise SipocTableError(
+                f"Column {COLUMN_LETTERS[column]} of the heading row should be \"{heading}\", "
+                f"as in the SIPOC table template",
+                code='header_mismatch', row=1, column=COLUMN_LETTERS[column],
+            )
+
+
+def _cell_text(value):
+    """Text of one spreadsheet value as it would appear in a CSV export."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class SipocRow(namedtuple('SipocRow', COLUMN_NAMES)):
+    """One process step: the six cells of a row, indexable by column number."""
+
+    __slots__ = ()
+
+
+class SipocTable:
+    """The whole uploaded SIPOC table, parsed once and shared by every slide builder.
+
+    rows keeps the sheet order: rows[0] is the heading row, rows[1] the core
+    process statement and rows[2:] the remaining process steps.
+    """
+
+    __slots__ = ('rows', 'source')
+
+    def __init__(self, rows, source=None):
+        self.rows = rows
+        self.source = source  # Path the table was read from, if any
+
+    @classmethod
+    def from_rows(cls, raw_rows, source=None, validate_header=False, max_rows=None, max_cell_chars=None):
+        """Build a table from lists of cell values, checking the A-F column layout.
+
+        Rows are checked as they are read, so an invalid table is rejected at
+        its first bad row without reading the rest: the heading row against the
+        template with validate_header, then the number of rows and the length
+        of every cell against the limits given. Blank rows count towards
+        max_rows too, so a sheet formatted far down is refused at the limit
+        instead of being read to its last row.
+        """
+        rows = []
+        for line_number, raw_row in enumerate(raw_rows, start=1):
+            cells = [_cell_text(cell) for cell in raw_row]
+            # Columns after F are only allowed when they are empty
+            if any(cell.strip() for cell in cells[NUM_COLUMNS:]):
+                raise SipocTableError(f"Row {line_number} has data after column F", code='extra_columns',
+                                      row=line_number)
+            cells = cells[:NUM_COLUMNS]
+            # Short rows are padded with empty cells
+            cells.extend([''] * (NUM_COLUMNS - len(cells)))
+
+            if line_number == 1 and validate_header:
+                check_header(cells)
+            blank = not any(cell.strip() for cell in cells)
+            if max_rows is not None and line_number > max_rows:
+                if blank:
+                    message = f"Row {line_number} is past the {max_rows} row limit; clear the blank rows below the table"
+                else:
+                    message = f"The table has more than {max_rows} rows"
+                raise SipocTableError(message, code='too_many_rows', row=line_number)
+            if max_cell_chars is not None and not blank:
+                for column, cell in enumerate(cells):
+                    if len(cell) > max_cell_chars:
+                        raise SipocTableError(
+                            f"Cell {COLUMN_LETTERS[column]}{line_number} is longer than {max_cell_chars} characters",
+                            code='cell_too_long', row=line_number, column=COLUMN_LETTERS[column],
+                        )
+            rows.append(SipocRow(*cells))
+
+        # Drop the blank rows left at the bottom of the template
+        while rows and not any(cell.strip() for cell in rows[-1]):
+            rows.pop()
+        if len(rows) < 2:
+            raise SipocTableError("The table needs a heading row and a core process statement row", code='missing_rows')
+        return cls(rows, source)
+
+    @classmethod
+    def from_csv(cls, file_path, **checks):
+        with open(file_path, 'r', newline='', encoding='utf-8-sig') as csv_file:
+            return cls.from_rows(csv.reader(csv_file), source=file_path, **checks)
+
+    @classmethod
+    def from_xlsx(cls, file_obj, source=None, **checks):
+        """Read the first sheet of a workbook from a path or a seekable file object.
+
+        The workbook is streamed in read-only mode, so nothing is written to disk.
+        checks are the validate_header, max_rows and max_cell_chars options of from_rows.
+        """
+        from openpyxl import load_workbook
+
+        try:
+            workbook = load_workbook(file_obj, read_only=True, data_only=True)
+        except Exception as e:
+            raise SipocTableError(f"The file could not be read as an Excel workbook: {str(e)}", code='unreadable_workbook')
+        try:
+            return cls.from_rows(workbook.active.iter_rows(values_only=True), source=source, **checks)
+        finally:
+            workbook.close()
+
+    @property
+    def header(self):
+        return self.rows[0]
+
+    @property
+    def core_row(self):
+        return self.rows[1]
+
+    @property
+    def process_rows(self):
+        return self.rows[2:]
+
+    def fingerprint(self):
+        """SHA-256 of the normalized cell contents; equal tables give equal fingerprints."""
+        digest = hashlib.sha256()
+        for row in self.rows:
+            # Unit and record separators cannot be typed into a cell
+            digest.update('\x1f'.join(row).encode('utf-8'))
+            digest.update(b'\x1e')
+        return digest.hexdigest()
+
+    def __len__(self):
+        return len(self.rows)
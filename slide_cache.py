@@ -0,0 +1,62 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from lxml import etree
+from pptx.oxml import parse_xml
+
+
+def slide_cache_key(generator_version, slide_number, dependencies):
+    """Key of one slide built by this generator version from the given part of the table."""
+    digest = hashlib.sha256(f"{generator_version}:{slide_number}:".encode('utf-8'))
+    digest.update(repr(dependencies).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def slide_xml(slide):
+    """Serialize the shape tree of a built slide."""
+    return etree.tostring(slide.shapes._spTree)
+
+
+def add_slide_from_xml(presentation, slide_layout, xml):
+    """Append a slide whose shapes are copied from slide_xml() output.
+
+    The builders only draw shapes and text boxes, which need no relationships,
+    so the shape tree can be moved between presentations as it is.
+    """
+    slide = presentation.slides.add_slide(slide_layout)
+    sp_tree = slide.shapes._spTree
+    sp_tree.getparent().replace(sp_tree, parse_xml(xml))
+    return slide
+
+
+class SlideCache:
+    """In-memory LRU cache of built slides, so re-uploads only rebuild the slides that changed."""
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            xml = self._entries.get(key)
+            if xml is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return xml
+
+    def put(self, key, xml):
+        with self._lock:
+            self._entries[key] = xml
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
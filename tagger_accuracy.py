@@ -0,0 +1,128 @@
+"""Compare a verb tagger backend against spaCy on SIPOC tables.
+
+Usage: python3 tagger_accuracy.py [--candidate lexicon] [--synthetic-rows 200] [table.csv|table.xlsx ...]
+
+The cells the slides tag (see analysis.py) are run through both backends,
+each in a fresh process so load time and resident memory are measured from
+a cold start. spaCy's tags are the reference: reported are precision and
+recall of the candidate's VERB tokens (core process statement slide), how
+often it agrees on whether a cell has a verb (verbs slide), and the cells
+where they disagree. Defaults to the sample table in uploads/ plus synthetic rows.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TABLES = [os.path.join(REPO_DIR, 'uploads', 'Excel-format.csv')]
+
+
+def load_cells(paths, synthetic_rows):
+    """Unique non-blank cells the slides tag, from every table."""
+    from analysis import core_row_cells, process_row_cells
+    from sipoc import SipocTable
+
+    tables = []
+    for path in paths:
+        if path.endswith('.csv'):
+            tables.append(SipocTable.from_csv(path))
+        else:
+            tables.append(SipocTable.from_xlsx(path, source=path))
+    if synthetic_rows:
+        from benchmark import synthetic_rows as make_rows
+        tables.append(SipocTable.from_rows(make_rows(rows=synthetic_rows, seed=1)))
+
+    cells = []
+    for table in tables:
+        cells.extend(core_row_cells(table) + process_row_cells(table))
+    return [cell for cell in dict.fromkeys(cells) if cell.strip()]
+
+
+def measure(backend, cells):
+    """Tag the cells in a fresh process; return its load time, memory and results."""
+    worker = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', backend],
+        input=json.dumps(cells), capture_output=True, text=True, cwd=REPO_DIR, check=True,
+    )
+    return json.loads(worker.stdout)
+
+
+def worker(backend):
+    """Body of the measuring process: cells on stdin, JSON report on stdout."""
+    cells = json.load(sys.stdin)
+    os.environ['PROH_VERB_TAGGER'] = backend
+    import nlp_models
+
+    memory_before = nlp_models.resident_memory_mb()
+    start = time.perf_counter()
+    nlp_models.prewarm()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [[verbs, has_verb] for _, verbs, has_verb in nlp_models.get_verb_tagger().analyse(cells)]
+    tag_seconds = time.perf_counter() - start
+    json.dump({
+        'load_seconds': load_seconds,
+        'tag_seconds': tag_seconds,
+        'rss_before_mb': memory_before,
+        'rss_after_mb': nlp_models.resident_memory_mb(),
+        'results': results,
+    }, sys.stdout)
+
+
+def compare(cells, reference, candidate, max_disagreements):
+    true_positives = reference_verbs = candidate_verbs = agreements = 0
+    disagreements = []
+    for cell, (expected, expected_has_verb), (found, found_has_verb) in zip(cells, reference, candidate):
+        # Verbs are compared as multisets per cell, so "checks ... checks" counts twice
+        true_positives += sum((Counter(expected) & Counter(found)).values())
+        reference_verbs += len(expected)
+        candidate_verbs += len(found)
+        agreements += expected_has_verb == found_has_verb
+        if (Counter(expected) != Counter(found) or expected_has_verb != found_has_verb) \
+                and len(disagreements) < max_disagreements:
+            disagreements.append({'cell': cell, 'reference': [expected, expected_has_verb],
+                                  'candidate': [found, found_has_verb]})
+    return {
+        'cells': len(cells),
+        'verb_precision': true_positives / candidate_verbs if candidate_verbs else 1.0,
+        'verb_recall': true_positives / reference_verbs if reference_verbs else 1.0,
+        'has_verb_agreement': agreements / len(cells) if cells else 1.0,
+        'disagreements': disagreements,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('tables', nargs='*', help='SIPOC tables (.xlsx or .csv) to take cells from')
+    parser.add_argument('--candidate', default='lexicon', help='backend compared against spaCy')
+    parser.add_argument('--synthetic-rows', type=int, default=200, help='synthetic rows added to the tables (0 for none)')
+    parser.add_argument('--max-disagreements', type=int, default=50, help='disagreeing cells listed in the report')
+    parser.add_argument('--output', help='write the report to this file as well')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker)
+        return
+
+    sys.path.insert(0, REPO_DIR)
+    cells = load_cells(args.tables or DEFAULT_TABLES, args.synthetic_rows)
+    reference = measure('spacy', cells)
+    candidate = measure(args.candidate, cells)
+
+    report = compare(cells, reference.pop('results'), candidate.pop('results'), args.max_disagreements)
+    report['backends'] = {'spacy': reference, args.candidate: candidate}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text)
+
+
+if __name__ == "__main__":
+    main()
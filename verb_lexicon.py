@@ -0,0 +1,176 @@
+"""Verb detection from a compact lexicon plus suffix rules, without loading spaCy.
+
+Only two things are needed from a tagger: which tokens are verbs (spaCy's
+pos_ == 'VERB', for the core process statement slide) and whether a cell has
+any VB* tag at all, auxiliaries included (for the verbs slide). SIPOC cells
+are short "<resource> <verb> <object>" phrases, so a lexicon of the verbs
+processes use, their inflections and a few context rules for words that are
+also nouns ("order", "works") get most of the way there. See
+tagger_accuracy.py for how closely it follows spaCy.
+"""
+import re
+
+# Split like spaCy's English tokenizer does for these short phrases: words (with inner
+# hyphens and apostrophes), numbers and single punctuation marks
+TOKEN_PATTERN = re.compile(r"\w+(?:[-'’]\w+)*|[^\w\s]")
+
+# Verbs used in process descriptions that are rarely anything else
+VERBS = """
+accept achieve acknowledge acquire adapt add adjust administer advise agree allocate analyse analyze
+announce apply appoint approve arrange ask assemble assess assign assist attach attend audit authorise
+authorize calculate cancel capture carry categorise choose claim clarify classify clean close collect
+combine communicate compare compile complete comply compute conclude conduct configure confirm
+consider consolidate construct consult create decide define delegate deliver determine develop
+discuss dispatch distribute document draft enter ensure establish evaluate examine execute explain
+extract fill finalise finalize fix forward gather generate give handle identify implement improve
+include inform initiate inspect install instruct integrate interview investigate issue keep lead
+learn maintain manage manufacture meet modify monitor negotiate notify obtain operate organise
+organize perform pick prepare present prioritise prioritize proceed produce provide publish
+receive recommend reconcile register reject remove repair replace reply require resolve respond
+retrieve select send share specify submit suggest take tell train transfer translate unpack
+use validate verify write
+""".split()
+
+# Words that are nouns as often as verbs; only tagged as verbs in verb positions
+AMBIGUOUS_VERBS = """
+answer book call change charge check contact control cost count cover delay demand design
+email estimate file finish forecast hold invoice label list load mail market measure need offer
+order pack package pay place plan post price print process purchase quote rate record release
+report request return review sample schedule ship sign stock store supply support test track
+transport update work
+""".split()
+
+# Irregular forms: past tense and past participle of verbs that do not add -ed
+IRREGULAR = {
+    'bring': ['brought'], 'build': ['built'], 'buy': ['bought'], 'choose': ['chose', 'chosen'],
+    'draw': ['drew', 'drawn'], 'find': ['found'], 'get': ['got', 'gotten'], 'give': ['gave', 'given'],
+    'go': ['went', 'gone'], 'hold': ['held'], 'keep': ['kept'], 'know': ['knew', 'known'], 'lead': ['led'],
+    'make': ['made'], 'meet': ['met'], 'pay': ['paid'], 'put': ['put'], 'read': ['read'], 'run': ['ran'],
+    'see': ['saw', 'seen'], 'sell': ['sold'], 'send': ['sent'], 'set': ['set'], 'take': ['took', 'taken'],
+    'tell': ['told'], 'think': ['thought'], 'write': ['wrote', 'written'],
+}
+VERBS += ['bring', 'build', 'buy', 'draw', 'find', 'get', 'go', 'know', 'make', 'read', 'run', 'see',
+          'sell', 'set', 'think']
+
+# Tagged VB* by spaCy, but AUX rather than VERB
+BE_FORMS = {'be', 'is', 'are', 'was', 'were', 'been', 'being', 'am', "'s", "'re", "'m"}
+# Auxiliaries before another verb, main verbs otherwise
+HAVE_DO_FORMS = {'have', 'has', 'had', 'having', 'do', 'does', 'did', 'done', 'doing'}
+# Words after which a base form is a verb ("to order", "must check")
+VERB_CONTEXT = {'to', 'will', 'shall', 'must', 'should', 'can', 'could', 'may', 'might', 'would', 'please'}
+# Words after which an -s form is a plural noun ("the orders", "new designs")
+NOUN_CONTEXT = {'a', 'an', 'the', 'this', 'that', 'these', 'those', 'all', 'any', 'each', 'every', 'some',
+                'no', 'its', 'their', 'our', 'your', 'his', 'her', 'new', 'other', 'of', 'for', 'and', 'or',
+                'with', 'from', 'by', 'in', 'on', 'at', 'per'}
+
+# Suffixes of words outside the lexicon that are verbs ("finalises", "prioritized", "notifies")
+VERB_SUFFIXES = ('ise', 'ises', 'ised', 'ising', 'ize', 'izes', 'ized', 'izing', 'ify', 'ifies', 'ified',
+                 'ifying', 'ates', 'ated', 'ating')
+# Words with those suffixes that are nouns or adjectives in process descriptions, with their plurals
+SUFFIX_EXCEPTIONS = """
+affiliate associate candidate certificate climate compromise concise enterprise estate exercise expertise
+franchise merchandise otherwise paradise plate precise premise promise state substrate template treatise
+""".split()
+SUFFIX_EXCEPTIONS += [word + 's' for word in SUFFIX_EXCEPTIONS]
+
+
+def _third_person(verb):
+    if verb.endswith(('s', 'x', 'z', 'ch', 'sh', 'o')):
+        return verb + 'es'
+    if verb.endswith('y') and verb[-2:-1] not in 'aeiou':
+        return verb[:-1] + 'ies'
+    return verb + 's'
+
+
+def _stem_for_suffix(verb):
+    """The verb as it is before -ed/-ing: doubled final consonant for short verbs ("planned")."""
+    if re.fullmatch(r'[^aeiou]*[aeiou][bdgklmnprt]', verb):
+        return verb + verb[-1]
+    return verb
+
+
+def _past(verb):
+    if verb.endswith('e'):
+        return verb + 'd'
+    if verb.endswith('y') and verb[-2:-1] not in 'aeiou':
+        return verb[:-1] + 'ied'
+    return _stem_for_suffix(verb) + 'ed'
+
+
+def _gerund(verb):
+    if verb.endswith('e') and not verb.endswith('ee'):
+        return verb[:-1] + 'ing'
+    return _stem_for_suffix(verb) + 'ing'
+
+
+def _forms(verbs):
+    """Map every inflected form of the verbs to its Penn tag."""
+    forms = {}
+    for verb in verbs:
+        forms[_gerund(verb)] = 'VBG'
+        for past in IRREGULAR.get(verb, [_past(verb)]):
+            forms[past] = 'VBN'
+        forms[_third_person(verb)] = 'VBZ'
+        forms[verb] = 'VB'
+    return forms
+
+
+_VERB_FORMS = _forms(VERBS)
+_AMBIGUOUS_FORMS = _forms(AMBIGUOUS_VERBS)
+_SUFFIX_EXCEPTIONS = frozenset(SUFFIX_EXCEPTIONS)
+
+
+class LexiconTagger:
+    """Tagger backend using the lexicon above; nothing to load, so no start-up cost."""
+
+    name = 'lexicon'
+    version = '2'  # Bump when the lexicon or the rules change, so cached results are not reused
+
+    def analyse(self, cells, batch_size=None):
+        """Yield (tokens, verbs, has_verb) for every cell, like the spaCy backend."""
+        for cell in cells:
+            tokens = TOKEN_PATTERN.findall(cell)
+            tags = self.tag(tokens)
+            verbs = [token for token, (pos, _) in zip(tokens, tags) if pos == 'VERB']
+            yield tokens, verbs, any(tag.startswith('VB') for _, tag in tags)
+
+    def tag(self, tokens):
+        """(coarse POS, Penn tag) per token; only verbs and auxiliaries are told apart from the rest."""
+        lowered = [token.lower() for token in tokens]
+        tags = []
+        for i, word in enumerate(lowered):
+            previous = lowered[i - 1] if i > 0 else None
+            following = lowered[i + 1] if i + 1 < len(lowered) else None
+            tags.append(self._tag_word(word, previous, following))
+        return tags
+
+    def _tag_word(self, word, previous, following):
+        if word in BE_FORMS:
+            return 'AUX', 'VBZ'
+        if word in HAVE_DO_FORMS:
+            # "has approved" is an auxiliary, "has a budget" is not
+            if following in _VERB_FORMS or following in _AMBIGUOUS_FORMS:
+                return 'AUX', 'VBZ'
+            return 'VERB', 'VBZ'
+
+        tag = _VERB_FORMS.get(word)
+        if tag is not None:
+            return 'VERB', tag
+
+        tag = _AMBIGUOUS_FORMS.get(word)
+        if tag is not None:
+            if tag in ('VBN', 'VBG'):
+                return 'VERB', tag
+            if tag == 'VBZ':
+                # "Customer orders furniture", but not "works order" or "receives orders"
+                if previous is not None and previous not in NOUN_CONTEXT and following is not None:
+                    return 'VERB', tag
+            elif previous in VERB_CONTEXT:
+                return 'VERB', tag
+            return 'NOUN', 'NN'
+
+        # "Supplier finalises", but not "the enterprise" or "new certificates"
+        if len(word) > 5 and word.endswith(VERB_SUFFIXES) and word not in _SUFFIX_EXCEPTIONS \
+                and previous not in NOUN_CONTEXT:
+            return 'VERB', 'VBZ' if word.endswith('s') else 'VB'
+        return 'X', 'XX'